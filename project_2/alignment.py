@@ -0,0 +1,918 @@
+from __future__ import annotations
+from collections import deque, namedtuple
+from enum import Enum
+import importlib.util
+from itertools import combinations
+from typing import Annotated, Iterator, Sized, Tuple, Optional
+import warnings
+from pathlib import Path
+import sys
+from dataclasses import dataclass
+import io
+from cost_only import (
+    construct_alphabet, LinearGap, AffineGap, ILLEGAL_CODE, translation_table, parse_configuration_file,
+    FastaRecord, read_fasta, _unit_cost_scale, edit_distance, python_global_cost
+)
+
+def lazy_import(name: str):
+    """Import a module on first attribute access, so that commands which
+    do not need it do not pay its import time"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+np = lazy_import("numpy")
+typer = lazy_import("typer")
+
+warnings.filterwarnings('ignore')
+
+
+# Helper dataclass and fn
+@dataclass
+class ConfigurationAlignment:
+    """Class for keeping alignment specification. The score matrix is
+    compiled into a contiguous int32 array, and the alphabet into a table
+    for bytes.translate mapping every byte to its code (255 if illegal)."""
+    gap: "LinearGap|AffineGap"
+    alphabet: dict[str: int]
+    score_matrix: np.ndarray
+    translation: bytes = None
+    def __post_init__(self):
+        if self.score_matrix is not None:
+            self.score_matrix = np.ascontiguousarray(self.score_matrix, dtype=np.int32)
+        if self.translation is None:
+            self.translation = translation_table(self.alphabet)
+
+def read_configuration_file(file: Path) -> ConfigurationAlignment:
+    "Read configuration file"
+    gap, alphabet, scores = parse_configuration_file(file)
+    return ConfigurationAlignment(gap, alphabet, np.array(scores, dtype=np.int32))
+
+def write_fasta(records: list[FastaRecord], f) -> None:
+    """Minimal FASTA writer, wrapping sequences at 60 characters"""
+    for description, sequence in records:
+        print(f">{description}", file = f)
+        for start in range(0, len(sequence), 60):
+            print(sequence[start:start+60], file = f)
+
+@dataclass
+class Matrix:
+    """Helper class for accessing cost matrix"""
+    mat: np.ndarray
+    def get_value(self, i: int, j: int) -> int:
+        "Getter for matrix"
+        return self.mat[i%self.mat.shape[0], j%self.mat.shape[1]]
+    def set_value(self,value: int,  i: int, j: int) -> None:
+        "Setter for matrix"
+        self.mat[i%self.mat.shape[0], j%self.mat.shape[1]] = value
+    def get_row(self, i: int) -> np.ndarray:
+        "Getter for a whole row"
+        return self.mat[i%self.mat.shape[0]]
+    def set_row(self, row: np.ndarray, i: int) -> None:
+        "Setter for a whole row"
+        self.mat[i%self.mat.shape[0]] = row
+
+class Engine(str, Enum):
+    """Available engines for filling the dynamic programming matrices"""
+    loop = "loop"
+    vectorized = "vectorized"
+
+
+def dna2int(x: str, alphabet_dict = {'A': 0, 'C': 1, 'G': 2, 'T': 3, '-': 4})-> list[int]:
+    '''
+    >>> dna2int('ACGT-A')
+    [0, 1, 2, 3, 4, 0]
+    '''
+    return list(alphabet_dict.get(char) for char in x.upper())
+
+def encode_sequence(x: str, conf: ConfigurationAlignment) -> np.ndarray:
+    """
+    Encode a sequence as an uint8 array of alphabet codes
+    >>> encode_sequence("ACgt-A", ConfigurationAlignment(LinearGap(5), construct_alphabet("ACGT-"), None))
+    array([0, 1, 2, 3, 4, 0], dtype=uint8)
+    """
+    codes = np.frombuffer(str(x).encode().translate(conf.translation), dtype=np.uint8)
+    if (codes == ILLEGAL_CODE).any():
+        char = str(x)[int(np.argmax(codes == ILLEGAL_CODE))]
+        raise ValueError(f"Illegal character {char!r} in input sequence")
+    return codes
+
+def score_profile(y: list[int], score_matrix: np.ndarray) -> np.ndarray:
+    """
+    Score rows of every alphabet character against a sequence, so that the
+    scores of x[i] against the whole of y are profile[x[i]]
+    >>> score_profile([0, 1, 1], np.array([[0, 5], [5, 0]]))
+    array([[0, 5, 5],
+           [5, 0, 0]])
+    """
+    return np.ascontiguousarray(np.asarray(score_matrix)[:, np.asarray(y, dtype=np.intp)])
+
+def int2dna(x: list[int], alphabet = {'A': 0, 'C': 1, 'G': 2, 'T': 3, '-': 4})-> str:
+    '''
+    >>> int2dna([0, 1, 2, 3, 4, 0])
+    'ACGT-A'
+    '''
+    alphabet = "".join(alphabet)
+    return "".join(alphabet[i] for i in x)
+
+## Algorithms
+
+def global_linear_matrix(
+    x: list[int], y: list[int], conf: ConfigurationAlignment,
+    linspace = False) -> np.ndarray:
+    """Fill global linear matrix for minimize problem"""
+    # Init empty matrix
+    dim = (len(x)+1, len(y)+1) if not linspace else (2, len(y)+1)
+    dyn_mat = Matrix(np.empty(dim, dtype=int))
+    # Define C function
+    def C(i: int, j: int)-> int:
+        if i == 0 and j == 0: return 0
+        if j == 0:  return i * conf.gap.value
+        if i == 0 and j != 0: return j * conf.gap.value
+        return np.min([
+            dyn_mat.get_value(i-1, j) + conf.gap.value,
+            dyn_mat.get_value(i, j-1) + conf.gap.value,
+            dyn_mat.get_value(i-1, j-1) + conf.score_matrix[x[i-1], y[j-1]]
+            ])
+    for i in range(len(x)+1):
+        for j in range(len(y)+1):
+            dyn_mat.set_value(C(i, j),i, j)
+    return dyn_mat
+
+def global_affine_matrix(
+    x: list[int], y: list[int], conf: ConfigurationAlignment) -> np.ndarray:
+    """Fill global linear matrix for minimize problem"""
+    dim = (len(x)+1, len(y)+1)
+    alpha, beta = conf.gap.alpha, conf.gap.beta
+    T, I, D = Matrix(np.full(dim, np.nan)), Matrix(np.full(dim, np.nan)), Matrix(np.full(dim, np.nan))
+    for i in range(len(x)+1):
+        for j in range(len(y)+1):
+            v1 = v2 = np.nan
+            if i > 0 and j >= 0:  v1 = T.get_value(i-1, j) + (alpha + beta)
+            if i > 1 and j >= 0:  v2 = D.get_value(i-1, j) + alpha
+            D.set_value(np.nanmin([v1, v2]), i, j)
+            v1 = v2 = np.nan
+            if i >= 0 and j > 0:  v1 = T.get_value(i, j-1) + (alpha+beta)
+            if i >= 0 and j > 1:  v2 = I.get_value(i, j-1) + alpha
+            I.set_value(np.nanmin([v1, v2]), i, j)
+            v1 = v2 = v3 = v4 = np.nan
+            if i == 0 and j == 0: v1 = 0
+            if i > 0 and j > 0: v2 = T.get_value(i-1, j-1) + conf.score_matrix[x[i-1], y[j-1]]
+            if i > 0 and j >= 0: v3 = D.get_value(i, j)
+            if i >= 0 and j > 0: v4 = I.get_value(i, j)
+            T.set_value(np.nanmin([v1, v2, v3, v4]), i, j)
+    return T, I, D
+
+def global_linear_matrix_vectorized(
+    x: list[int], y: list[int], conf: ConfigurationAlignment,
+    linspace = False) -> Matrix:
+    """
+    Fill global linear matrix for minimize problem one row at a time.
+    The horizontal gaps of a row are solved as a cumulative min-scan, so
+    every row is a handful of NumPy operations instead of a Python loop.
+    >>> conf = ConfigurationAlignment(LinearGap(5), construct_alphabet("ACGT-"), np.matrix(
+    ...     [[0, 5, 2, 5], [5, 0, 5, 2], [2, 5, 0, 5], [5, 2, 5, 0]]))
+    >>> x, y = dna2int("ACGTGTCAACGT"), dna2int("ACGTCGTAGCTA")
+    >>> int(global_linear_matrix_vectorized(x, y, conf).get_value(len(x), len(y)))
+    22
+    >>> bool((global_linear_matrix_vectorized(x, y, conf).mat == global_linear_matrix(x, y, conf).mat).all())
+    True
+    """
+    g = conf.gap.value
+    dim = (len(x)+1, len(y)+1) if not linspace else (2, len(y)+1)
+    dyn_mat = Matrix(np.empty(dim, dtype=int))
+    profile = score_profile(y, conf.score_matrix)
+    offsets = g * np.arange(len(y)+1)
+    dyn_mat.set_row(offsets, 0)
+    for i in range(1, len(x)+1):
+        previous = dyn_mat.get_row(i-1)
+        # Best cost entering each cell from above or from the diagonal
+        vertical = np.empty(len(y)+1, dtype=int)
+        vertical[0] = previous[0] + g
+        vertical[1:] = np.minimum(previous[1:] + g, previous[:-1] + profile[x[i-1]])
+        # C(i, j) = min_k vertical[k] + (j-k)*g
+        dyn_mat.set_row(np.minimum.accumulate(vertical - offsets) + offsets, i)
+    return dyn_mat
+
+def global_affine_matrix_vectorized(
+    x: list[int], y: list[int], conf: ConfigurationAlignment) -> Tuple[Matrix, Matrix, Matrix]:
+    """
+    Fill global affine matrices for minimize problem one row at a time.
+    D only depends on the previous row, and I is computed as an exclusive
+    cumulative min-scan over the cells of the same row not ending in an
+    insertion. Falls back to the loop engine if the gap opening cost is
+    negative, as the scan is only exact when merging two gaps never pays.
+    >>> conf = ConfigurationAlignment(AffineGap(5, 5), construct_alphabet("ACGT-"), np.matrix(
+    ...     [[0, 5, 2, 5], [5, 0, 5, 2], [2, 5, 0, 5], [5, 2, 5, 0]]))
+    >>> x, y = dna2int("ACGTGTCAACGT"), dna2int("ACGTCGTAGCTA")
+    >>> T, I, D = global_affine_matrix_vectorized(x, y, conf)
+    >>> int(T.get_value(len(x), len(y)))
+    24
+    >>> all(np.array_equal(a.mat, b.mat, equal_nan=True) for a, b in
+    ...     zip((T, I, D), global_affine_matrix(x, y, conf)))
+    True
+    """
+    alpha, beta = conf.gap.alpha, conf.gap.beta
+    if beta < 0:
+        return global_affine_matrix(x, y, conf)
+    dim = (len(x)+1, len(y)+1)
+    T, I, D = Matrix(np.empty(dim)), Matrix(np.empty(dim)), Matrix(np.empty(dim))
+    for i, rows in enumerate(global_affine_rows(x, y, conf.score_matrix, alpha, beta)):
+        for mat, row in zip((T, I, D), rows):
+            mat.set_row(row, i)
+    # Keep the same representation of unreachable cells as the loop engine
+    for mat in (T, I, D):
+        mat.mat[np.isinf(mat.mat)] = np.nan
+    return T, I, D
+
+def global_affine_rows(
+    x: list[int], y: list[int], score_matrix: np.ndarray,
+    alpha: int, beta: int, tb: float = float("inf")
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yield the rows (T, I, D) of the global affine matrices using only
+    O(len(y)) memory. Unreachable cells are inf. tb is the cost of opening
+    a deletion at the very beginning of x (inf means the usual alpha + beta),
+    which lets divide and conquer continue a gap started in another block.
+    """
+    profile = score_profile(y, score_matrix)
+    offsets = alpha * np.arange(len(y)+1)
+    T, I, D = offsets + float(beta), offsets + float(beta), np.full(len(y)+1, np.inf)
+    T[0], I[0], D[0] = 0, np.inf, tb
+    yield T, I, D
+    for i in range(1, len(x)+1):
+        D = np.minimum(T + (alpha + beta), D + alpha)
+        # Best cost of each cell when not ending in an insertion
+        closed = D.copy()
+        closed[1:] = np.minimum(T[:-1] + profile[x[i-1]], closed[1:])
+        I = np.empty(len(y)+1)
+        I[0] = np.inf
+        I[1:] = np.minimum.accumulate((closed - offsets)[:-1]) + offsets[1:] + beta
+        T = np.minimum(closed, I)
+        yield T, I, D
+
+LINEAR_ENGINES = {Engine.loop: global_linear_matrix, Engine.vectorized: global_linear_matrix_vectorized}
+AFFINE_ENGINES = {Engine.loop: global_affine_matrix, Engine.vectorized: global_affine_matrix_vectorized}
+
+def global_affine_backtrack(
+    T: np.ndarray, I: np.ndarray, D: np.ndarray,
+    A: list[int], B: list[int], conf: ConfigurationAlignment,
+    aligned_1 = None, aligned_2 = None
+    )-> Tuple[list[int], list[int]]:
+    """Compute alignment in linear time using the whole cost matrix"""
+    aligned_1, aligned_2 = list(), list()
+    i, j = len(A), len(B)
+    while i != 0 and j != 0:
+        if T[i, j] == (T[i-1, j-1] + conf.score_matrix[A[i-1], B[j-1]]):
+            aligned_1.append(A[i-1])
+            aligned_2.append(B[j-1])
+            i -= 1
+            j -= 1
+        if T[i, j] == D[i, j]:
+            while D[i, j] == D[i-1, j] + conf.gap.alpha:
+                aligned_1.append(A[i-1])
+                aligned_2.append(conf.alphabet["-"])
+                i -= 1
+            aligned_1.append(A[i-1])
+            aligned_2.append(conf.alphabet["-"])
+            i -= 1
+        if T[i, j] == I[i, j]:
+            while I[i, j] == I[i, j-1] + conf.gap.alpha:
+                aligned_1.append(conf.alphabet["-"])
+                aligned_2.append(B[i-1])
+                j -= 1
+            aligned_1.append(conf.alphabet["-"])
+            aligned_2.append(B[i-1])
+            j -= 1
+    return (int2dna(reversed(aligned_1)), int2dna(reversed(aligned_2)))
+
+def global_linear_backtrack(
+    T: np.ndarray,
+    A: list[int], B: list[int], conf: ConfigurationAlignment,
+    aligned_1 = None, aligned_2 = None
+    )-> Tuple[list[int], list[int]]:
+    """Compute alignment in linear time using the whole cost matrix"""
+    aligned_1, aligned_2 = list(), list()
+    i, j = len(A), len(B)
+    while i != 0 and j != 0:
+        if (i > 0) and (j > 0) and T[i,j] == T[i-1, j-1] +  conf.score_matrix[A[i-1], B[j-1]]:
+            aligned_1.append(A[i-1])
+            aligned_2.append(B[j-1])
+            i -= 1
+            j -= 1
+        if (i > 0) and (j >= 0) and T[i,j] == T[i-1,j] + conf.gap.value:
+            aligned_1.append(A[i-1])
+            aligned_2.append(conf.alphabet["-"])
+            i -= 1
+        if (i>=0) and (j > 0) and T[i,j] == T[i,j-1] + conf.gap.value:
+            aligned_1.append(conf.alphabet["-"])
+            aligned_2.append(B[j-1])
+            j -= 1
+    return (int2dna(reversed(aligned_1)), int2dna(reversed(aligned_2)))
+
+def gap_costs(conf: ConfigurationAlignment) -> Tuple[int, int]:
+    """
+    Gap cost as (alpha, beta) such that g(k) = alpha*k + beta. A linear gap
+    cost is an affine one without opening cost.
+    >>> gap_costs(ConfigurationAlignment(LinearGap(5), {}, None))
+    (5, 0)
+    """
+    if isinstance(conf.gap, AffineGap):
+        return conf.gap.alpha, conf.gap.beta
+    return conf.gap.value, 0
+
+def alignment_cost(aligned_1: list[int], aligned_2: list[int], conf: ConfigurationAlignment) -> int:
+    """
+    Cost of a given alignment
+    >>> conf = ConfigurationAlignment(AffineGap(5, 5), construct_alphabet("ACGT-"), np.matrix(
+    ...     [[0, 5, 2, 5], [5, 0, 5, 2], [2, 5, 0, 5], [5, 2, 5, 0]]))
+    >>> alignment_cost(dna2int("AC--GT"), dna2int("A-CAGT"), conf)
+    25
+    """
+    alpha, beta = gap_costs(conf)
+    gap = conf.alphabet["-"]
+    cost, previous = 0, None
+    for a, b in zip(aligned_1, aligned_2):
+        if a == gap or b == gap:
+            state = "D" if b == gap else "I"
+            cost += alpha if state == previous else alpha + beta
+        else:
+            state = "T"
+            cost += conf.score_matrix[a, b]
+        previous = state
+    return int(cost)
+
+# Blocks with at most this many cells are aligned with full matrices
+HIRSCHBERG_BLOCK = 4096
+
+def _block_alignment(
+    x: np.ndarray, y: np.ndarray, conf: ConfigurationAlignment, tb: float, te: float
+    ) -> Tuple[list[int], list[int]]:
+    """Align a small block using the whole cost matrices. tb and te are the
+    opening costs of a deletion at the start and at the end of the block."""
+    alpha, beta = gap_costs(conf)
+    T, I, D = (np.array(mat) for mat in zip(*global_affine_rows(x, y, conf.score_matrix, alpha, beta, tb)))
+    return _affine_traceback(T, I, D, x, y, conf, te)
+
+def _affine_traceback(
+    T: np.ndarray, I: np.ndarray, D: np.ndarray,
+    x: np.ndarray, y: np.ndarray, conf: ConfigurationAlignment, te: float
+    ) -> Tuple[list[int], list[int]]:
+    """Backtrack through the whole affine cost matrices, where te is the
+    opening cost of a deletion at the end of the alignment."""
+    alpha, beta = gap_costs(conf)
+    gap = conf.alphabet["-"]
+    aligned_1, aligned_2 = list(), list()
+    i, j = len(x), len(y)
+    state = "D" if D[i, j] - beta + te < T[i, j] else "T"
+    while i > 0 or j > 0:
+        if state == "T":
+            if i > 0 and j > 0 and T[i, j] == T[i-1, j-1] + conf.score_matrix[x[i-1], y[j-1]]:
+                aligned_1.append(x[i-1])
+                aligned_2.append(y[j-1])
+                i -= 1
+                j -= 1
+            else:
+                state = "D" if T[i, j] == D[i, j] else "I"
+        elif state == "D":
+            aligned_1.append(x[i-1])
+            aligned_2.append(gap)
+            if D[i, j] != D[i-1, j] + alpha:
+                state = "T"
+            i -= 1
+        else:
+            aligned_1.append(gap)
+            aligned_2.append(y[j-1])
+            if I[i, j] != I[i, j-1] + alpha:
+                state = "T"
+            j -= 1
+    return aligned_1[::-1], aligned_2[::-1]
+
+def global_linspace_alignment(
+    x: list[int], y: list[int], conf: ConfigurationAlignment) -> Tuple[str, str]:
+    """
+    Compute an optimal alignment in linear space by divide and conquer
+    (Hirschberg, with the Myers-Miller extension for affine gap cost).
+    Each block is split at its middle row, where an optimal path either
+    crosses through a cell or in the middle of a deletion that continues
+    into the lower block.
+    >>> conf = ConfigurationAlignment(AffineGap(5, 5), construct_alphabet("ACGT-"), np.matrix(
+    ...     [[0, 5, 2, 5], [5, 0, 5, 2], [2, 5, 0, 5], [5, 2, 5, 0]]))
+    >>> global_linspace_alignment(dna2int("ACGTGTCAACGT"), dna2int("ACGTCGTAGCTA"), conf)
+    ('ACGTGTCAACGT', 'ACGTCGTAGCTA')
+    >>> aligned_1, aligned_2 = global_linspace_alignment(dna2int("AAAAAAAACGT"), dna2int("AAGT"), conf)
+    >>> alignment_cost(dna2int(aligned_1), dna2int(aligned_2), conf)
+    40
+    """
+    alpha, beta = gap_costs(conf)
+    x, y = np.asarray(x), np.asarray(y)
+    aligned_1, aligned_2 = list(), list()
+    # Blocks (x_lo, x_hi, y_lo, y_hi, tb, te), solved from left to right
+    blocks = [(0, len(x), 0, len(y), beta, beta)]
+    while blocks:
+        x_lo, x_hi, y_lo, y_hi, tb, te = blocks.pop()
+        n, m = x_hi - x_lo, y_hi - y_lo
+        if n <= 1 or m == 0 or (n+1)*(m+1) <= HIRSCHBERG_BLOCK:
+            block_1, block_2 = _block_alignment(x[x_lo:x_hi], y[y_lo:y_hi], conf, tb, te)
+            aligned_1.extend(block_1)
+            aligned_2.extend(block_2)
+            continue
+        mid = x_lo + n//2
+        for T_f, _, D_f in global_affine_rows(x[x_lo:mid], y[y_lo:y_hi], conf.score_matrix, alpha, beta, tb):
+            pass
+        for T_b, _, D_b in global_affine_rows(x[mid:x_hi][::-1], y[y_lo:y_hi][::-1], conf.score_matrix, alpha, beta, te):
+            pass
+        through_cell = T_f + T_b[::-1]
+        through_gap = D_f + D_b[::-1] - beta
+        j, k = int(np.argmin(through_cell)), int(np.argmin(through_gap))
+        if through_gap[k] < through_cell[j]:
+            # x[mid-1] and x[mid] are deleted by the same gap
+            blocks.append((mid+1, x_hi, y_lo+k, y_hi, 0, te))
+            blocks.append((mid-1, mid+1, y_lo+k, y_lo+k, 0, 0))
+            blocks.append((x_lo, mid-1, y_lo, y_lo+k, tb, 0))
+        else:
+            blocks.append((mid, x_hi, y_lo+j, y_hi, beta, te))
+            blocks.append((x_lo, mid, y_lo, y_lo+j, tb, beta))
+    return (int2dna(aligned_1), int2dna(aligned_2))
+
+def unit_cost_scale(conf: ConfigurationAlignment) -> Optional[int]:
+    """
+    If the configuration is unit cost (up to a positive factor), i.e. linear
+    gap cost g, free matches and every mismatch costing g, return g.
+    >>> unit_cost_scale(ConfigurationAlignment(LinearGap(1), {}, np.matrix([[0, 1], [1, 0]])))
+    1
+    >>> unit_cost_scale(ConfigurationAlignment(LinearGap(1), {}, np.matrix([[0, 2], [2, 0]]))) is None
+    True
+    """
+    return _unit_cost_scale(conf.gap, np.asarray(conf.score_matrix).tolist())
+
+def global_cost(x: list[int], y: list[int], conf: ConfigurationAlignment, engine = Engine.vectorized) -> int:
+    """
+    Optimal cost of a global alignment, in linear space whenever the engine allows it.
+    Unit cost configurations use the bit-parallel edit distance instead.
+    >>> conf = ConfigurationAlignment(AffineGap(5, 5), construct_alphabet("ACGT-"), np.matrix(
+    ...     [[0, 5, 2, 5], [5, 0, 5, 2], [2, 5, 0, 5], [5, 2, 5, 0]]))
+    >>> global_cost(dna2int("ACGTGTCAACGT"), dna2int("ACGTCGTAGCTA"), conf)
+    24
+    """
+    if isinstance(conf.gap, LinearGap):
+        scale = unit_cost_scale(conf)
+        if scale and engine == Engine.vectorized:
+            return scale * edit_distance(x, y)
+        return int(LINEAR_ENGINES[engine](x, y, conf, linspace = True).get_value(len(x), len(y)))
+    if engine == Engine.loop or conf.gap.beta < 0:
+        T, _, _ = AFFINE_ENGINES[engine](x, y, conf)
+        return int(T.get_value(len(x), len(y)))
+    for T, _, _ in global_affine_rows(x, y, conf.score_matrix, conf.gap.alpha, conf.gap.beta):
+        pass
+    return int(T[len(y)])
+
+# State shared by the pairwise workers, set once per process
+_pairwise_state = None
+
+def _init_pairwise(encoded: list[list[int]], conf: ConfigurationAlignment, engine: Engine) -> None:
+    global _pairwise_state
+    score = np.asarray(conf.score_matrix)
+    alpha, beta = gap_costs(conf)
+    symmetric = bool((score == score.T).all())
+    # With non-negative costs and free matches, a sequence aligns with itself at cost 0
+    free_diagonal = not score.diagonal().any() and score.min() >= 0 and min(alpha, beta) >= 0
+    _pairwise_state = (encoded, conf, engine, symmetric, free_diagonal)
+
+def _pairwise_row(i: int) -> list[int]:
+    """Costs of row i, from the diagonal onwards if the score matrix is symmetric"""
+    encoded, conf, engine, symmetric, free_diagonal = _pairwise_state
+    row = list()
+    for j in range(i if symmetric else 0, len(encoded)):
+        if i == j and free_diagonal:
+            row.append(0)
+        else:
+            row.append(global_cost(encoded[i], encoded[j], conf, engine))
+    return row
+
+def _read_finished_rows(output: Path, n: int) -> list[list[int]]:
+    """Read the complete rows of an interrupted run, dropping a partially written row"""
+    if not output.is_file():
+        return list()
+    with output.open("r+") as f:
+        text = f.read()
+        finished = text[:text.rfind("\n")+1]
+        f.seek(len(finished.encode()))
+        f.truncate()
+    rows = [[int(x) for x in line.split()] for line in finished.splitlines()]
+    if len(rows) > n or any(len(row) != n for row in rows):
+        raise ValueError(f"{output} does not look like a partial {n}x{n} cost matrix")
+    return rows
+
+def write_pairwise_matrix(
+    sequences: Path, conf: ConfigurationAlignment, engine: Engine,
+    output: Path, jobs: int = 1, resume: bool = False) -> None:
+    """
+    Write all pairwise costs as a matrix, one row at a time. Sequences are
+    encoded once, only the upper triangle is computed when the score matrix
+    is symmetric, and rows are spread over a pool of processes. With resume,
+    the rows already in output are kept and only the missing ones computed.
+    """
+    encoded = [encode_sequence(x.sequence, conf) for x in read_fasta(sequences)]
+    n = len(encoded)
+    rows = _read_finished_rows(output, n) if resume else list()
+    _init_pairwise(encoded, conf, engine)
+    symmetric = _pairwise_state[3]
+    from multiprocessing import Pool
+    pool = Pool(jobs, initializer = _init_pairwise, initargs = (encoded, conf, engine)) if jobs > 1 else None
+    results = pool.imap(_pairwise_row, range(len(rows), n)) if pool else map(_pairwise_row, range(len(rows), n))
+    try:
+        with output.open("a" if resume else "w") as f:
+            for i, computed in enumerate(results, start = len(rows)):
+                row = [rows[k][i] for k in range(i)] + computed if symmetric else computed
+                rows.append(row)
+                print(" ".join(str(x) for x in row), file = f, flush = True)
+    finally:
+        if pool:
+            pool.terminate()
+
+@dataclass
+class Band:
+    """Helper class for accessing a banded matrix stored by diagonals j - i"""
+    mat: np.ndarray
+    lo: int
+    def __getitem__(self, index: Tuple[int, int]) -> float:
+        "Getter for matrix, cells outside the band are unreachable"
+        i, j = index
+        d = j - i - self.lo
+        return self.mat[i, d] if 0 <= d < self.mat.shape[1] else np.inf
+
+BandedAlignment = namedtuple("BandedAlignment", ["cost", "band", "optimal", "alignment"])
+
+# Narrower bands are not faster, as each row costs a few NumPy calls anyway
+BAND_START = 32
+
+def global_banded_rows(
+    x: list[int], y: list[int], score_matrix: np.ndarray,
+    alpha: int, beta: int, lo: int, hi: int
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yield the rows (T, I, D) of the global affine matrices restricted to the
+    diagonals lo <= j - i <= hi, so that row i is indexed by j - i - lo.
+    Cells outside the band or the matrix are inf.
+    """
+    profile = score_profile(y, score_matrix)
+    d = np.arange(lo, hi+1)
+    offsets = alpha * d
+    T = np.where((d >= 0) & (d <= len(y)), offsets + float(beta), np.inf)
+    I, D = T.copy(), np.full(len(d), np.inf)
+    T[d == 0], I[d == 0] = 0, np.inf
+    yield T, I, D
+    for i in range(1, len(x)+1):
+        j = i + d
+        outside = (j < 0) | (j > len(y))
+        # (i-1, j) lies on the next diagonal of the previous row
+        D = np.minimum(np.append(T[1:], np.inf) + (alpha + beta), np.append(D[1:], np.inf) + alpha)
+        D[outside] = np.inf
+        # Cells with a diagonal predecessor are the contiguous j in [max(1, i+lo), min(m, i+hi)]
+        j_lo, j_hi = max(1, i + lo), min(len(y), i + hi)
+        substitution = np.full(len(d), np.inf)
+        if j_lo <= j_hi:
+            substitution[j_lo - i - lo:j_hi - i - lo + 1] = profile[x[i-1], j_lo-1:j_hi]
+        closed = np.minimum(T + substitution, D)
+        I = np.full(len(d), np.inf)
+        I[1:] = np.minimum.accumulate((closed - offsets)[:-1]) + offsets[1:] + beta
+        I[outside] = np.inf
+        T = np.minimum(closed, I)
+        yield T, I, D
+
+def _out_of_band_bound(n: int, m: int, k: int, conf: ConfigurationAlignment) -> float:
+    """
+    Lower bound on the cost of any alignment leaving the band of width k.
+    Such a path reaches a diagonal k+1 away from the band, so it has at
+    least |m-n| + 2(k+1) gap symbols, in at least one insertion and one
+    deletion.
+    """
+    alpha, beta = gap_costs(conf)
+    gaps = abs(m - n) + 2*(k + 1)
+    if gaps > n + m:
+        return np.inf
+    if alpha < 0 or beta < 0:
+        return -np.inf
+    min_score = min(0, int(np.asarray(conf.score_matrix).min()))
+    return alpha*gaps + 2*beta + min_score*((n + m - gaps)//2)
+
+def global_banded_alignment(
+    x: list[int], y: list[int], conf: ConfigurationAlignment,
+    band: Optional[int] = None, backtrack = False) -> BandedAlignment:
+    """
+    Global alignment restricted to the diagonals within distance band of the
+    ones joining (0, 0) and (n, m). Without a given band, it starts at
+    BAND_START and doubles it (Ukkonen) until the cost is proven optimal, i.e., it is not
+    larger than a lower bound for every alignment leaving the band.
+    >>> conf = ConfigurationAlignment(LinearGap(5), construct_alphabet("ACGT-"), np.matrix(
+    ...     [[0, 5, 2, 5], [5, 0, 5, 2], [2, 5, 0, 5], [5, 2, 5, 0]]))
+    >>> global_banded_alignment(dna2int("ACGTGTCAACGT"), dna2int("ACGTCGTAGCTA"), conf, backtrack = True)
+    BandedAlignment(cost=22, band=32, optimal=True, alignment=('ACGT-GTCAACGT', 'ACGTCGT-AGCTA'))
+    >>> global_banded_alignment(dna2int("ACGTGTCAACGT"), dna2int("ACGTCGTAGCTA"), conf, band = 1)
+    BandedAlignment(cost=22, band=1, optimal=False, alignment=None)
+    """
+    alpha, beta = gap_costs(conf)
+    n, m = len(x), len(y)
+    k = BAND_START if band is None else band
+    while True:
+        lo, hi = min(0, m - n) - k, max(0, m - n) + k
+        for T, _, _ in global_banded_rows(x, y, conf.score_matrix, alpha, beta, lo, hi):
+            pass
+        cost = T[m - n - lo]
+        optimal = (lo <= -n and hi >= m) or cost <= _out_of_band_bound(n, m, k, conf)
+        if optimal or band is not None:
+            break
+        k *= 2
+    alignment = None
+    if backtrack:
+        # Only the final band is stored
+        T, I, D = (np.array(mat) for mat in zip(*global_banded_rows(x, y, conf.score_matrix, alpha, beta, lo, hi)))
+        aligned_1, aligned_2 = _affine_traceback(Band(T, lo), Band(I, lo), Band(D, lo), x, y, conf, beta)
+        alignment = (int2dna(aligned_1), int2dna(aligned_2))
+    return BandedAlignment(int(cost), k, bool(optimal), alignment)
+
+# CLI app
+
+# Commands are registered here and the typer app is only created when needed
+COMMANDS = list()
+
+def command(fn):
+    """Register a function as a command of the CLI app"""
+    COMMANDS.append(fn)
+    return fn
+
+def create_app():
+    """Create the typer app with all registered commands"""
+    app = typer.Typer()
+    for fn in COMMANDS:
+        app.command()(fn)
+    return app
+
+def read_CLI_input(
+    sequence_1: Path, sequence_2: Path, configuration: Path, output: Optional[Path]
+    ):
+    """Helper function for reading input"""
+    seq1, seq2 = next(read_fasta(sequence_1)), next(read_fasta(sequence_2))
+    conf = read_configuration_file(configuration)
+    f = output.open("w") if output else sys.stdout
+    return (seq1, seq2, conf, f)
+
+
+def print_linspace_alignment(seq1, seq2, x: list[int], y: list[int], conf: ConfigurationAlignment, f):
+    """Helper function for printing an alignment computed in linear space"""
+    aligned_1, aligned_2 = global_linspace_alignment(x, y, conf)
+    cost = alignment_cost(dna2int(aligned_1), dna2int(aligned_2), conf)
+    print(f"; The optimal cost of this alignment is {cost}", file = f)
+    write_fasta([seq1._replace(sequence = aligned_1), seq2._replace(sequence = aligned_2)], f)
+
+def read_pairs(
+    sequences_1: Optional[Path], sequences_2: Optional[Path], pairs: Optional[Path]
+    ) -> Iterator[Tuple[str, str, str, str]]:
+    """
+    Stream pairs (name_1, sequence_1, name_2, sequence_2), either from the
+    records of two multi-FASTA files taken in order, or from a TSV file with
+    two sequences or two names and sequences per line.
+    """
+    if pairs is None:
+        for record_1, record_2 in zip(read_fasta(sequences_1), read_fasta(sequences_2), strict = True):
+            yield (*record_1, *record_2)
+        return
+    with pairs.open() as f:
+        for number, line in enumerate(f, start = 1):
+            fields = line.rstrip("\n").split("\t")
+            if not line.strip():
+                continue
+            if len(fields) == 2:
+                yield (f"pair{number}_1", fields[0], f"pair{number}_2", fields[1])
+            elif len(fields) == 4:
+                yield tuple(fields)
+            else:
+                raise ValueError(f"Line {number} of {pairs} should have 2 or 4 tab-separated fields")
+
+# State shared by the batch workers, set once per process
+_batch_state = None
+
+def _init_batch(conf: ConfigurationAlignment, print_alignment: bool) -> None:
+    global _batch_state
+    _batch_state = (conf, print_alignment)
+
+def _align_pair(pair: Tuple[str, str, str, str]) -> str:
+    """Align a pair and return its output: a TSV line with the cost or, with
+    alignments, the cost comment followed by the aligned FASTA records"""
+    conf, print_alignment = _batch_state
+    name_1, sequence_1, name_2, sequence_2 = pair
+    x, y = encode_sequence(sequence_1, conf), encode_sequence(sequence_2, conf)
+    if not print_alignment:
+        return f"{name_1}\t{name_2}\t{global_cost(x, y, conf)}\n"
+    f = io.StringIO()
+    print_linspace_alignment(FastaRecord(name_1, sequence_1), FastaRecord(name_2, sequence_2), x, y, conf, f)
+    return f.getvalue()
+
+def _bounded_imap(pool, func, iterable, window: int):
+    """Like pool.imap, but without reading more than window items ahead"""
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+@command
+def global_linear_linspace(
+    sequence_1: Path, sequence_2: Path,
+    configuration: Path,
+    print_alignment: Annotated[bool, typer.Option("--print-alignment")] = False,
+    engine: Annotated[Engine, typer.Option("--engine")] = Engine.vectorized,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = None
+    ):
+    """
+    This program finds the cost of a global alignment and, optionally, the 
+    alignment itself in quadratic time and linear space. 
+    """
+    seq1, seq2, conf, f = read_CLI_input(sequence_1, sequence_2, configuration, output)
+    x, y = encode_sequence(seq1.sequence, conf), encode_sequence(seq2.sequence, conf)
+    if print_alignment:
+        print_linspace_alignment(seq1, seq2, x, y, conf, f)
+        return
+    print(f"; The optimal cost of this alignment is {global_cost(x, y, conf, engine)}", file = f)
+
+@command
+def global_affine_linspace(
+    sequence_1: Path, sequence_2: Path,
+    configuration: Path,
+    print_alignment: Annotated[bool, typer.Option("--print-alignment")] = False,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = None
+    ):
+    """
+    This program finds the cost of a global alignment with affine gap cost and,
+    optionally, the alignment itself in quadratic time and linear space. 
+    """
+    seq1, seq2, conf, f = read_CLI_input(sequence_1, sequence_2, configuration, output)
+    x, y = encode_sequence(seq1.sequence, conf), encode_sequence(seq2.sequence, conf)
+    if print_alignment:
+        print_linspace_alignment(seq1, seq2, x, y, conf, f)
+        return
+    print(f"; The optimal cost of this alignment is {global_cost(x, y, conf)}", file = f)
+
+@command
+def global_linear(
+    sequence_1: Path, sequence_2: Path,
+    configuration: Path,
+    print_alignment: Annotated[bool, typer.Option("--print-alignment")] = False,
+    engine: Annotated[Engine, typer.Option("--engine")] = Engine.vectorized,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = None
+    ):
+    """
+    This program finds the cost of a global alignment and, optionally, the 
+    alignment itself in quadratic time and space. 
+    """
+    
+    seq1, seq2, conf, f = read_CLI_input(sequence_1, sequence_2, configuration, output)
+    x, y = encode_sequence(seq1.sequence, conf), encode_sequence(seq2.sequence, conf)
+    args = [x, y, conf]
+    mat = LINEAR_ENGINES[engine](*args)
+    print(f"; The optimal cost of this alignment is {mat.get_value(len(x), len(y))}", file = f)
+    if print_alignment:
+        aligned_1, aligned_2 = global_linear_backtrack(mat.mat, *args)
+        write_fasta([seq1._replace(sequence = aligned_1), seq2._replace(sequence = aligned_2)], f)
+
+def print_banded_alignment(
+    seq1, seq2, x: list[int], y: list[int], conf: ConfigurationAlignment,
+    band: Optional[int], print_alignment: bool, f):
+    """Helper function for printing a banded alignment and the band it used"""
+    result = global_banded_alignment(x, y, conf, band, print_alignment)
+    if result.optimal:
+        print(f"; The optimal cost of this alignment is {result.cost}", file = f)
+    else:
+        print(f"; The cost of this alignment is {result.cost}", file = f)
+    print(f"; Band width {result.band}, {'proven' if result.optimal else 'not proven'} optimal", file = f)
+    if print_alignment:
+        write_fasta([seq1._replace(sequence = result.alignment[0]), seq2._replace(sequence = result.alignment[1])], f)
+
+@command
+def global_linear_banded(
+    sequence_1: Path, sequence_2: Path,
+    configuration: Path,
+    band: Annotated[Optional[int], typer.Option("--band", min = 0)] = None,
+    print_alignment: Annotated[bool, typer.Option("--print-alignment")] = False,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = None
+    ):
+    """
+    This program finds the cost of a global alignment and, optionally, the
+    alignment itself, only filling a band around the main diagonal. Without
+    --band, the band is doubled until the cost is proven optimal.
+    """
+    seq1, seq2, conf, f = read_CLI_input(sequence_1, sequence_2, configuration, output)
+    x, y = encode_sequence(seq1.sequence, conf), encode_sequence(seq2.sequence, conf)
+    print_banded_alignment(seq1, seq2, x, y, conf, band, print_alignment, f)
+
+@command
+def global_affine_banded(
+    sequence_1: Path, sequence_2: Path,
+    configuration: Path,
+    band: Annotated[Optional[int], typer.Option("--band", min = 0)] = None,
+    print_alignment: Annotated[bool, typer.Option("--print-alignment")] = False,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = None
+    ):
+    """
+    This program finds the cost of a global alignment with affine gap cost and,
+    optionally, the alignment itself, only filling a band around the main
+    diagonal. Without --band, the band is doubled until the cost is proven optimal.
+    """
+    seq1, seq2, conf, f = read_CLI_input(sequence_1, sequence_2, configuration, output)
+    x, y = encode_sequence(seq1.sequence, conf), encode_sequence(seq2.sequence, conf)
+    print_banded_alignment(seq1, seq2, x, y, conf, band, print_alignment, f)
+
+@command
+def batch(
+    configuration: Path,
+    sequences_1: Annotated[Optional[Path], typer.Argument()] = None,
+    sequences_2: Annotated[Optional[Path], typer.Argument()] = None,
+    pairs: Annotated[Optional[Path], typer.Option("--pairs")] = None,
+    print_alignment: Annotated[bool, typer.Option("--print-alignment")] = False,
+    jobs: Annotated[int, typer.Option("--jobs", "-j", min = 1)] = 1,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = None
+    ):
+    """
+    This program aligns many pairs of sequences in a single process, taking the
+    i-th records of two multi-FASTA files or the lines of a TSV file (--pairs).
+    Results are written as soon as they are found, in input order: a TSV line
+    with the names and the cost or, with --print-alignment, the aligned
+    sequences computed in linear space.
+    """
+    from_fasta = sequences_1 is not None and sequences_2 is not None
+    if (pairs is None and not from_fasta) or (pairs is not None and (sequences_1 or sequences_2)):
+        raise typer.BadParameter("Give either two FASTA files or a TSV file with --pairs")
+    conf = read_configuration_file(configuration)
+    f = output.open("w") if output else sys.stdout
+    pairs = read_pairs(sequences_1, sequences_2, pairs)
+    _init_batch(conf, print_alignment)
+    from multiprocessing import Pool
+    pool = Pool(jobs, initializer = _init_batch, initargs = (conf, print_alignment)) if jobs > 1 else None
+    results = _bounded_imap(pool, _align_pair, pairs, 4*jobs) if pool else map(_align_pair, pairs)
+    try:
+        for result in results:
+            f.write(result)
+            f.flush()
+    finally:
+        if pool:
+            pool.terminate()
+
+@command
+def pairwise_global_linear(
+    sequences: Path,
+    configuration: Path,
+    jobs: Annotated[int, typer.Option("--jobs", "-j", min = 1)] = 1,
+    resume: Annotated[bool, typer.Option("--resume")] = False,
+    engine: Annotated[Engine, typer.Option("--engine")] = Engine.vectorized,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = Path("/dev/stdout")
+
+    ):
+    """
+    This program finds all pairwise cost for a global linear alignment. 
+    """
+    conf = read_configuration_file(configuration)
+    write_pairwise_matrix(sequences, conf, engine, output, jobs, resume)
+
+@command
+def pairwise_global_affine(
+    sequences: Path,
+    configuration: Path,
+    jobs: Annotated[int, typer.Option("--jobs", "-j", min = 1)] = 1,
+    resume: Annotated[bool, typer.Option("--resume")] = False,
+    engine: Annotated[Engine, typer.Option("--engine")] = Engine.vectorized,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = Path("/dev/stdout")
+    ):
+    """
+    This program finds all pairwise cost for a global affine alignment. 
+    """
+    conf = read_configuration_file(configuration)
+    write_pairwise_matrix(sequences, conf, engine, output, jobs, resume)
+
+@command
+def global_affine(
+    sequence_1: Path, sequence_2: Path,
+    configuration: Path,
+    print_alignment: Annotated[bool, typer.Option("--print-alignment")] = False,
+    engine: Annotated[Engine, typer.Option("--engine")] = Engine.vectorized,
+    output: Annotated[Optional[Path], typer.Option("--outfile", "-o")] = None
+    ):
+    """
+    This program finds the cost of a global alignment and, optionally, the 
+    alignment itself in quadratic time and space. 
+    """
+    seq1, seq2, conf, f = read_CLI_input(sequence_1, sequence_2, configuration, output)
+    x, y = encode_sequence(seq1.sequence, conf), encode_sequence(seq2.sequence, conf)
+    args = [x, y, conf]
+    T, I, D = AFFINE_ENGINES[engine](*args)
+    print(f"; The optimal cost of this alignment is {int(T.get_value(len(x), len(y)))}", file = f)
+    if print_alignment:
+        aligned_1, aligned_2 = global_affine_backtrack(T.mat, I.mat, D.mat, *args)
+        write_fasta([seq1._replace(sequence = aligned_1), seq2._replace(sequence = aligned_2)], f)
@@ -0,0 +1,32 @@
+#!/bin/bash
+# Startup time budget for the cost only commands, which skip typer and NumPy,
+# as the time they take beyond a bare interpreter start (python -c pass)
+# Usage: bash benchmark/startup.sh [budget in ms]
+budget=${1:-40}
+runs=10
+mean_ms() {
+    local total=0
+    for _ in $(seq $runs)
+    do
+        local start=$(date +%s%N)
+        "$@" >/dev/null
+        total=$(( total + $(date +%s%N) - start ))
+    done
+    echo $(( total / runs / 1000000 ))
+}
+bare=$(mean_ms python -c pass)
+echo "python -c pass,$bare ms"
+for algo in global-linear global-affine
+do
+for i in 1 4
+do
+mean=$(mean_ms python main.py $algo-linspace tests/case$i/seq1.fasta tests/case$i/seq2.fasta \
+    tests/$algo.conf)
+echo "$algo-linspace case$i,$mean ms,$(( mean - bare )) ms over python (budget $budget ms)"
+if [ $(( mean - bare )) -gt $budget ]
+then
+    echo "Startup time budget exceeded for $algo-linspace"
+    exit 1
+fi
+done
+done
@@ -0,0 +1,199 @@
+"""
+Configuration and FASTA parsers and the cost only entry point of main.py,
+which must start fast: only modules Python loads at start-up are imported
+here, the CLI in alignment.py (typer, NumPy, dataclasses) is not.
+"""
+from __future__ import annotations
+from collections import namedtuple
+from collections.abc import Iterator
+import os
+import sys
+
+def construct_alphabet(x: str) -> dict[str: int]:
+    return {char:index for index, char in enumerate(x)}
+
+LinearGap = namedtuple("LinearGap", ["value"])
+AffineGap = namedtuple("AffineGap", ["alpha", "beta"])
+
+
+ILLEGAL_CODE = 255
+
+def translation_table(alphabet: dict[str: int]) -> bytes:
+    """Table for bytes.translate mapping every byte to its code in the alphabet"""
+    table = bytearray([ILLEGAL_CODE]) * 256
+    for char, code in alphabet.items():
+        table[ord(char.upper())] = table[ord(char.lower())] = code
+    return bytes(table)
+
+def parse_configuration_file(file: str | os.PathLike) -> tuple["LinearGap|AffineGap", dict[str: int], list[list[int]]]:
+    "Parse configuration file into gap cost, alphabet and score rows, without NumPy"
+    with open(file) as f:
+        lines = [line.rstrip('\n') for line in f]
+        gap_line = lines[0].split()
+        gap = AffineGap(int(gap_line[0]), int(gap_line[1])) if len(gap_line) == 2 else LinearGap(int(gap_line[0]))
+        parsing = dict()
+        for line in lines[1:]:
+            chars = line.split()
+            parsing[chars[0]] = [int(x) for x in chars[1:]]
+        alphabet = construct_alphabet("".join(parsing.keys()) + "-")
+        return gap, alphabet, list(parsing.values())
+
+
+FastaRecord = namedtuple("FastaRecord", ["description", "sequence"])
+
+def read_fasta(file: str | os.PathLike) -> Iterator[FastaRecord]:
+    """Minimal FASTA reader, streaming the records of a file and skipping
+    empty and ';' comment lines"""
+    description, chunks = None, list()
+    with open(file) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(";"):
+                continue
+            if line.startswith(">"):
+                if description is not None:
+                    yield FastaRecord(description, "".join(chunks))
+                description, chunks = line[1:].strip(), list()
+            elif description is not None:
+                chunks.append("".join(line.split()))
+    if description is not None:
+        yield FastaRecord(description, "".join(chunks))
+
+
+def _unit_cost_scale(gap: "LinearGap|AffineGap", scores: list[list[int]]) -> int | None:
+    if not isinstance(gap, LinearGap) or gap.value <= 0:
+        return None
+    for a, row in enumerate(scores):
+        if len(row) != len(scores) or any(score != (0 if a == b else gap.value) for b, score in enumerate(row)):
+            return None
+    return gap.value
+
+def edit_distance(x: list[int], y: list[int]) -> int:
+    """
+    Unit cost edit distance with the bit-parallel algorithm of Myers, in the
+    formulation of Hyyro, using Python integers as bit-vectors. Each column of
+    the dynamic programming matrix is encoded by its vertical differences
+    (+1 in Pv, -1 in Mv) and computed with a constant number of operations.
+    >>> edit_distance(b"ACGTGTCAACGT", b"ACGTCGTAGCTA")
+    5
+    >>> edit_distance([], [0, 1])
+    2
+    """
+    x, y = bytes(x), bytes(y)
+    if len(x) < len(y):
+        x, y = y, x
+    if not x:
+        return len(y)
+    peq = dict()
+    for i, char in enumerate(x):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    full, last = (1 << len(x)) - 1, 1 << (len(x) - 1)
+    Pv, Mv, score = full, 0, len(x)
+    for char in y:
+        Eq = peq.get(char, 0)
+        Xv = Eq | Mv
+        Xh = (((Eq & Pv) + Pv) ^ Pv) | Eq
+        Ph = (Mv | ~(Xh | Pv)) & full
+        Mh = Pv & Xh
+        if Ph & last:
+            score += 1
+        elif Mh & last:
+            score -= 1
+        # The first row of a global alignment increases by one in every column
+        Ph = ((Ph << 1) | 1) & full
+        Mh = (Mh << 1) & full
+        Pv = (Mh | ~(Xv | Ph)) & full
+        Mv = Ph & Xv
+    return score
+
+def python_global_cost(x: bytes, y: bytes, gap: "LinearGap|AffineGap", scores: list[list[int]]) -> int:
+    """
+    Optimal cost of a global alignment in pure Python, one row at a time.
+    For short sequences this is done before NumPy would have been imported.
+    >>> scores = [[0, 5, 2, 5], [5, 0, 5, 2], [2, 5, 0, 5], [5, 2, 5, 0]]
+    >>> table = translation_table(construct_alphabet("ACGT-"))
+    >>> x, y = b"ACGTGTCAACGT".translate(table), b"ACGTCGTAGCTA".translate(table)
+    >>> python_global_cost(x, y, LinearGap(5), scores), python_global_cost(x, y, AffineGap(5, 5), scores)
+    (22, 24)
+    """
+    if isinstance(gap, LinearGap):
+        g = gap.value
+        T = [g*j for j in range(len(y)+1)]
+        for char in x:
+            row_scores = scores[char]
+            left = T[0] + g
+            T_new = [left]
+            for diagonal, up, b in zip(T, T[1:], y):
+                cost = diagonal + row_scores[b]
+                if up + g < cost:
+                    cost = up + g
+                if left + g < cost:
+                    cost = left + g
+                T_new.append(cost)
+                left = cost
+            T = T_new
+        return T[len(y)]
+    alpha, beta = gap.alpha, gap.beta
+    open_cost = alpha + beta
+    inf = float("inf")
+    T = [0] + [alpha*j + beta for j in range(1, len(y)+1)]
+    D = [inf] * (len(y)+1)
+    for char in x:
+        row_scores = scores[char]
+        left = min(T[0] + open_cost, D[0] + alpha)
+        T_new, D_new = [left], [left]
+        I = inf
+        for diagonal, up, up_deletion, b in zip(T, T[1:], D[1:], y):
+            # Deletion (gap in y) and insertion (gap in x) ending here
+            deletion = up + open_cost
+            if up_deletion + alpha < deletion:
+                deletion = up_deletion + alpha
+            I += alpha
+            if left + open_cost < I:
+                I = left + open_cost
+            cost = diagonal + row_scores[b]
+            if deletion < cost:
+                cost = deletion
+            if I < cost:
+                cost = I
+            D_new.append(deletion)
+            T_new.append(cost)
+            left = cost
+        T, D = T_new, D_new
+    return T[len(y)]
+
+
+# Cost only commands that skip typer, and NumPy when the pair is short or unit cost
+FAST_COMMANDS = {"global-linear-linspace": LinearGap, "global-affine-linspace": AffineGap}
+# Largest pair for which the pure Python engine beats importing NumPy
+FAST_PATH_CELLS = 40_000
+
+def cost_only(argv: list[str]) -> bool:
+    """
+    Lightweight entry point for `main.py global-(linear|affine)-linspace SEQ1
+    SEQ2 CONF [-o OUTFILE]`. Returns False if the arguments need the full CLI.
+    """
+    if len(argv) not in (4, 6) or argv[0] not in FAST_COMMANDS or any(x.startswith("-") for x in argv[1:4]):
+        return False
+    if len(argv) == 6 and argv[4] not in ("-o", "--outfile"):
+        return False
+    gap, alphabet, scores = parse_configuration_file(argv[3])
+    if not isinstance(gap, FAST_COMMANDS[argv[0]]):
+        return False
+    table = translation_table(alphabet)
+    x, y = (next(read_fasta(file)).sequence.encode().translate(table) for file in argv[1:3])
+    if ILLEGAL_CODE in x or ILLEGAL_CODE in y:
+        return False
+    scale = _unit_cost_scale(gap, scores)
+    if scale:
+        cost = scale * edit_distance(x, y)
+    elif len(x) * len(y) <= FAST_PATH_CELLS:
+        cost = python_global_cost(x, y, gap, scores)
+    else:
+        import numpy as np
+        from alignment import global_cost, read_configuration_file
+        x, y = np.frombuffer(x, dtype=np.uint8), np.frombuffer(y, dtype=np.uint8)
+        cost = global_cost(x, y, read_configuration_file(argv[3]))
+    f = open(argv[5], "w") if len(argv) == 6 else sys.stdout
+    print(f"; The optimal cost of this alignment is {cost}", file = f)
+    return True
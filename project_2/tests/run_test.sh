@@ -1,17 +1,109 @@
+for engine in loop vectorized
+do
 for i in {1..4}
 do
 for algo in global-linear global-affine
 do
-echo Testing case $i: for $algo
-python main.py $algo --print-alignment tests/case$i/seq1.fasta \
+echo Testing case $i: for $algo with $engine engine
+python main.py $algo --print-alignment --engine $engine tests/case$i/seq1.fasta \
     tests/case$i/seq2.fasta tests/$algo.conf -o tmp.fasta
 bash tests/scripts/cmp.sh tmp.fasta tests/expected/$algo\_$i.fasta
 rm tmp.fasta
 done;
 algo="global-linear-linspace"
-echo Testing case $i: for $algo
-python main.py $algo tests/case$i/seq1.fasta \
+echo Testing case $i: for $algo with $engine engine
+python main.py $algo --engine $engine tests/case$i/seq1.fasta \
      tests/case$i/seq2.fasta tests/$algo.conf -o tmp.fasta
 bash tests/scripts/cmp.sh tmp.fasta tests/expected/$algo\_$i.fasta
 rm tmp.fasta
-done
\ No newline at end of file
+done;
+done
+# Linear space alignments may pick another optimal alignment, so only the cost is compared
+for i in {1..4}
+do
+for algo in global-linear global-affine
+do
+echo Testing case $i: for $algo-linspace with alignment
+python main.py $algo-linspace --print-alignment tests/case$i/seq1.fasta \
+    tests/case$i/seq2.fasta tests/$algo.conf -o tmp.fasta
+head -n 1 tmp.fasta > tmp_cost.fasta
+head -n 1 tests/expected/$algo\_$i.fasta > tmp_expected.fasta
+bash tests/scripts/cmp.sh tmp_cost.fasta tmp_expected.fasta
+python main.py $algo-linspace tests/case$i/seq1.fasta \
+    tests/case$i/seq2.fasta tests/$algo.conf -o tmp.fasta
+bash tests/scripts/cmp.sh tmp.fasta tmp_expected.fasta
+rm tmp.fasta tmp_cost.fasta tmp_expected.fasta
+done;
+done
+for algo in global-linear global-affine
+do
+echo Testing pairwise-$algo in parallel
+python main.py pairwise-$algo --jobs 2 results/sequences.fasta results/$algo.conf -o tmp.txt
+bash tests/scripts/cmp.sh tmp.txt tests/expected/pairwise-$algo.txt
+echo Testing pairwise-$algo resuming an interrupted run
+head -n 2 tests/expected/pairwise-$algo.txt > tmp.txt
+printf "243 2" >> tmp.txt
+python main.py pairwise-$algo --resume results/sequences.fasta results/$algo.conf -o tmp.txt
+bash tests/scripts/cmp.sh tmp.txt tests/expected/pairwise-$algo.txt
+rm tmp.txt
+done
+for i in {1..4}
+do
+for algo in global-linear global-affine
+do
+echo Testing case $i: for $algo-banded with alignment
+python main.py $algo-banded --print-alignment tests/case$i/seq1.fasta \
+    tests/case$i/seq2.fasta tests/$algo.conf -o tmp.fasta
+head -n 1 tmp.fasta > tmp_cost.fasta
+head -n 1 tests/expected/$algo\_$i.fasta > tmp_expected.fasta
+bash tests/scripts/cmp.sh tmp_cost.fasta tmp_expected.fasta
+rm tmp.fasta tmp_cost.fasta tmp_expected.fasta
+done;
+done
+for i in {1..4}
+do
+echo Testing case $i: for global-linear-linspace with unit cost
+python main.py global-linear-linspace --engine loop tests/case$i/seq1.fasta \
+    tests/case$i/seq2.fasta tests/unit-cost.conf -o tmp_expected.fasta
+python main.py global-linear-linspace tests/case$i/seq1.fasta \
+    tests/case$i/seq2.fasta tests/unit-cost.conf -o tmp.fasta
+bash tests/scripts/cmp.sh tmp.fasta tmp_expected.fasta
+rm tmp.fasta tmp_expected.fasta
+done
+for algo in global-linear global-affine
+do
+echo Testing batch for $algo
+for i in {1..4}
+do
+cat tests/case$i/seq1.fasta >> tmp_1.fasta; echo >> tmp_1.fasta
+cat tests/case$i/seq2.fasta >> tmp_2.fasta; echo >> tmp_2.fasta
+head -n 1 tests/expected/$algo\_$i.fasta | sed 's/.* //' >> tmp_expected.txt
+done
+python main.py batch --jobs 2 tests/$algo.conf tmp_1.fasta tmp_2.fasta | cut -f 3 > tmp.txt
+bash tests/scripts/cmp.sh tmp.txt tmp_expected.txt
+rm tmp.txt tmp_expected.txt tmp_1.fasta tmp_2.fasta
+done
+for algo in global-linear global-affine
+do
+echo Testing $algo-linspace cost only starts without NumPy, typer, Biopython and the CLI module
+python -X importtime main.py $algo-linspace tests/case4/seq1.fasta \
+    tests/case4/seq2.fasta tests/$algo.conf -o tmp.fasta 2> tmp_imports.txt
+if grep -E "\|\s*(numpy|typer|Bio|alignment|dataclasses|typing)$" tmp_imports.txt
+then
+    echo "Heavy imports on the cost only path"
+    exit 2
+fi
+rm tmp.fasta tmp_imports.txt
+done
+# Above FAST_PATH_CELLS the cost only path falls back to the NumPy engines
+(echo ">long1"; grep -hv ">" tests/case4/seq1.fasta tests/case4/seq2.fasta) > tmp_1.fasta
+(echo ">long2"; grep -hv ">" tests/case4/seq2.fasta tests/case4/seq1.fasta) > tmp_2.fasta
+for algo in global-linear global-affine
+do
+echo Testing $algo-linspace cost only on a pair longer than the pure Python limit
+python main.py $algo --engine loop tmp_1.fasta tmp_2.fasta tests/$algo.conf -o tmp_expected.fasta
+python main.py $algo-linspace tmp_1.fasta tmp_2.fasta tests/$algo.conf -o tmp.fasta
+bash tests/scripts/cmp.sh tmp.fasta tmp_expected.fasta
+rm tmp.fasta tmp_expected.fasta
+done
+rm tmp_1.fasta tmp_2.fasta
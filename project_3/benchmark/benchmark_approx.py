@@ -2,6 +2,7 @@ from memory_profiler import profile
 import numpy as np
 from typing import Tuple, Optional
 import itertools
+import functools
 from Bio import SeqIO, SeqRecord, Seq
 import Bio
 from dataclasses import dataclass
@@ -32,6 +33,29 @@ def int2dna(x: list[int])-> str:
     collapsed = "".join(ALPHABET)
     return "".join(collapsed[i] for i in x)
 
+# Columns of up to this many characters are scored from a 5^k lookup table
+MAX_TABLE_COLUMN = 6
+# Codes of the characters of an alignment, indexed by their bytes
+CODES = np.full(256, GAP_CHAR, dtype = np.uint8)
+for char, code in ALPHABET.items():
+    CODES[ord(char)] = CODES[ord(char.lower())] = code
+
+@functools.lru_cache(maxsize = None)
+def get_column_costs(k: int)-> np.ndarray:
+    """Sum-of-pairs cost of every column of k characters, as a read-only 5^k lookup table
+    >>> int(get_column_costs(3)[0, 1, 2])
+    12
+    """
+    costs = np.zeros((len(ALPHABET),)*k, dtype = "int")
+    score = np.asarray(SCORE_MATRIX)
+    for x, y in itertools.combinations(range(k), 2):
+        shape = [1]*k
+        shape[x], shape[y] = len(ALPHABET), len(ALPHABET)
+        # score[a, b] placed on axes x and y
+        costs = costs + score.reshape(shape)
+    costs.setflags(write = False)
+    return costs
+
 def score_sum_pairs(*chars: Optional[int])-> int:
     """
     >>> score_sum_pairs(0, 0, 0)
@@ -40,8 +64,35 @@ def score_sum_pairs(*chars: Optional[int])-> int:
     12
     >>> score_sum_pairs(0, 1)
     5
+    >>> score_sum_pairs(0, 1, 2, 3, 4, 0, 1)
+    83
+    """
+    if len(chars) <= MAX_TABLE_COLUMN:
+        return int(get_column_costs(len(chars))[chars])
+    return score_columns(np.array(chars).reshape(-1, 1))
+
+def score_columns(M: np.ndarray)-> int:
+    """
+    Sum-of-pairs cost of the alignment of codes M (a row per sequence). A
+    column with h[x] characters x costs sum h[x] h[y] S[x, y] over x < y,
+    h S h / 2 as S has a zero diagonal, so the cost is found from the
+    L x 5 histogram of the columns in O(L k) array operations.
+    >>> score_columns(np.array([[0, 1, 4], [0, 4, 2]]))
+    10
+    """
+    histogram = np.stack([(M == code).sum(axis = 0) for code in range(len(ALPHABET))], axis = 1)
+    return int(((histogram @ np.asarray(SCORE_MATRIX)) * histogram).sum()) // 2
+
+def score_msa(*sequences: str)-> int:
+    """
+    Sum-of-pairs cost of aligned sequences
+    >>> score_msa('GTTCCGAAAGGCTAGCGCTAGGC-GCC-', 'AT---GGAT--TT-AT-CTGCTC-TTCG', '-T---GCATG-CTGAAACTTCTCAACCA')
+    198
     """
-    return sum(SCORE_MATRIX[x, y] for x, y in itertools.combinations(chars, 2))
+    if not sequences:
+        return 0
+    M = CODES[np.frombuffer("".join(sequences).encode(), dtype = np.uint8)]
+    return score_columns(M.reshape(len(sequences), -1))
 
 @dataclass
 class MSA:
@@ -69,8 +120,21 @@ def get_previous_index(index, comb):
     """
     return tuple(i - 1 if v else i for i, v in zip(index, comb))
 
+def get_moves(k: int)-> np.ndarray:
+    """All the 2^k - 1 moves of the k-dimensional DP, 1 where a sequence advances
+    >>> get_moves(2).tolist()
+    [[0, 1], [1, 0], [1, 1]]
+    """
+    return np.array([comb for comb in itertools.product([0, 1], repeat=k) if any(comb)], dtype = "int")
+
 def compute_exact_alignment(*seq)-> np.ndarray:
     """
+    Cost of optimal alignments of all prefixes of the sequences. The cells
+    with the same sum of indexes (an anti-diagonal plane) depend only on
+    earlier planes, so each plane is filled at once with NumPy: for each of
+    the 2^k - 1 moves, a fixed offset into the flattened table gives the
+    previous cells and the column costs come from the 5^k lookup table. The
+    table has a border of infinite costs in front, so no move leaves it.
     >>> compute_exact_alignment("")[-1]
     0
     >>> compute_exact_alignment("", "", "")[-1, -1, -1]
@@ -80,20 +144,38 @@ def compute_exact_alignment(*seq)-> np.ndarray:
     >>> compute_exact_alignment("AATAAT", "AAGG")[-1, -1]
     14
     """
-    sequences: Tuple[int] = tuple(dna2int(x) for x in seq)
-    shapes = tuple(len(x)+1 for x in sequences)
-    D = np.zeros(shapes, dtype = "int")
-    for index in np.ndindex(D.shape):
-        possibilities = set()
-        for direction in get_plausible_path(index):
-            previous_cost = D[get_previous_index(index, direction)]
-            extension_cost = score_sum_pairs(
-                *[sequence[v-1] if v else GAP_CHAR for v, sequence in zip(direction, sequences)]
-            )
-            possibilities.add(previous_cost + extension_cost)
-        if possibilities:
-            D[index] = min(possibilities)    
-    return D
+    # Each sequence ends with a gap, read at index -1 by moves out of the border
+    sequences = [np.array(dna2int(x) + [GAP_CHAR], dtype = "int") for x in seq]
+    k = len(sequences)
+    shapes = tuple(len(x) for x in sequences)
+    infinity = np.iinfo(np.int32).max // 2
+    D = np.full(tuple(n + 1 for n in shapes), infinity, dtype = np.int32)
+    D[(1,)*k] = 0
+    flat = D.reshape(-1)
+    strides = np.array(D.strides) // D.itemsize
+    moves = get_moves(k)
+    offsets = moves @ strides
+    costs = get_column_costs(k).reshape(-1).astype(np.int32)
+    # Index into costs of the column of gaps, and what each character adds
+    weights = len(ALPHABET) ** np.arange(k - 1, -1, -1)
+    gaps = GAP_CHAR * weights.sum()
+    # Cells of the first k - 1 dimensions sorted by their sum of indexes,
+    # the last index of a cell in a plane is then fixed
+    heads = np.indices(shapes[:-1]).reshape(k - 1, int(np.prod(shapes[:-1])))
+    order = np.argsort(heads.sum(axis = 0), kind = "stable")
+    heads = heads[:, order]
+    head_sums = heads.sum(axis = 0)
+    last = shapes[-1] - 1
+    for plane in range(1, sum(shapes) - k + 1):
+        begin, end = np.searchsorted(head_sums, [plane - last, plane + 1])
+        index = np.vstack((heads[:, begin:end], plane - head_sums[begin:end]))
+        index = index[:, index[-1] >= 0]
+        cells = (index + 1).T @ strides
+        # Columns of every move into every cell, as indexes into costs
+        chars = np.array([sequence[i - 1] for sequence, i in zip(sequences, index)])
+        columns = gaps + moves @ ((chars - GAP_CHAR) * weights[:, None])
+        flat[cells] = (flat[cells - offsets[:, None]] + costs[columns]).min(axis = 0)
+    return D[(slice(1, None),)*k]
 
 def linear_backtrack(D: np.ndarray, *seq):
     """Compute alignment in linear time using the whole cost matrix"""
@@ -110,7 +192,7 @@ def linear_backtrack(D: np.ndarray, *seq):
                 break
     return tuple(int2dna(seq.tolist()) for seq in np.flip(alignment,axis = 1))
 
-def global_alignment(*sequences) -> MSA:
+def global_alignment(*sequences, linear: Optional[bool] = None) -> MSA:
     """
     Compute an optimal global alignment of 3 sequences
     >>> global_alignment("")
@@ -125,13 +207,90 @@ def global_alignment(*sequences) -> MSA:
     MSA(cost=101, sequences=('-A', '--', '-C', 'GG', 'AA', '-C'))
     >>> global_alignment("GTTCCGAAAGGCTAGCGCTAGGCGCC", "ATGGATTTATCTGCTCTTCG", "TGCATGCTGAAACTTCTCAACCA")
     MSA(cost=198, sequences=('GTTCCGAAAGGCTAGCGCTAGGC-GCC-', 'AT---GGAT--TT-AT-CTGCTC-TTCG', '-T---GCATG-CTGAAACTTCTCAACCA'))
+
+    Three sequences are aligned in linear memory by divide_and_conquer if
+    linear, by default when the full table has more than MAX_TABLE_CELLS.
     """
+    if linear is None:
+        linear = len(sequences) == 3 and np.prod([len(x) + 1 for x in sequences]) > MAX_TABLE_CELLS
+    if linear:
+        return divide_and_conquer(*sequences)
     D = compute_exact_alignment(*sequences)
     return MSA(
-        D[tuple(i-1 for i in D.shape)],
+        int(D[tuple(i-1 for i in D.shape)]),
         linear_backtrack(D, *sequences)
         )
 
+# Largest 3-way table (in cells, 4 bytes each) filled in full by global_alignment
+MAX_TABLE_CELLS = 2**24
+
+def last_plane(x: np.ndarray, y: np.ndarray, z: np.ndarray)-> np.ndarray:
+    """
+    Costs of optimal alignments of x with all prefixes of y and z, the last
+    plane of the 3-way table, computed keeping two planes at a time. Moves
+    from the previous plane are whole-plane operations; within a plane, each
+    row j depends on row j - 1, and the moves along a row are a prefix scan:
+    D[j, k] = min(A[k], D[j, k-1] + w[k]) is W[k] + min(A[t] - W[t], t <= k)
+    for the prefix sums W of w.
+    """
+    T, S = get_column_costs(3).astype(np.int64), np.asarray(SCORE_MATRIX, dtype = np.int64)
+    infinity = np.iinfo(np.int64).max // 4
+    # Costs of the moves within a plane
+    T010, T011 = T[GAP_CHAR, y, GAP_CHAR], T[GAP_CHAR, y[:, None], z[None, :]]
+    W = np.concatenate(([0], np.cumsum(T[GAP_CHAR, GAP_CHAR, z])))
+    Syz = S[y[:, None], z[None, :]]
+    C = np.full((len(y) + 1, len(z) + 1), infinity, dtype = np.int64)
+    C[0, 0] = 0
+    buffer = np.empty(len(z) + 1, dtype = np.int64)
+    for i in range(len(x) + 1):
+        if i:
+            a, previous = x[i - 1], D
+            C = previous + T[a, GAP_CHAR, GAP_CHAR]
+            np.minimum(C[1:, :], previous[:-1, :] + T[a, y, GAP_CHAR][:, None], out = C[1:, :])
+            np.minimum(C[:, 1:], previous[:, :-1] + T[a, GAP_CHAR, z][None, :], out = C[:, 1:])
+            T111 = Syz + S[a, y][:, None] + S[a, z][None, :]
+            np.minimum(C[1:, 1:], previous[:-1, :-1] + T111, out = C[1:, 1:])
+        # The rows are completed in place, without temporary arrays
+        D, diagonal = C, np.empty(len(z), dtype = np.int64)
+        for j in range(len(y) + 1):
+            row = D[j]
+            if j:
+                np.minimum(row, np.add(D[j - 1], T010[j - 1], out = buffer), out = row)
+                np.minimum(row[1:], np.add(D[j - 1, :-1], T011[j - 1], out = diagonal), out = row[1:])
+            np.subtract(row, W, out = row)
+            np.minimum.accumulate(row, out = row)
+            np.add(row, W, out = row)
+    return D
+
+def divide_and_conquer(*sequences: str)-> MSA:
+    """
+    Optimal alignment of 3 sequences in memory linear in the product of the
+    two shorter lengths (Hirschberg): the longest sequence is split in half,
+    the costs to and from its middle plane give the cell of an optimal path
+    there, and the two halves are aligned the same way. Small enough parts
+    are aligned with the full table.
+    >>> divide_and_conquer("GTTCCGAAAGGCTAGCGCTAGGCGCC", "ATGGATTTATCTGCTCTTCG", "TGCATGCTGAAACTTCTCAACCA").cost
+    198
+    """
+    if np.prod([len(x) + 1 for x in sequences]) <= MAX_TABLE_CELLS or max(map(len, sequences)) <= 1:
+        return global_alignment(*sequences, linear = False)
+    # The sum-of-pairs cost is symmetric, so split the longest sequence
+    first = max(range(3), key = lambda s: len(sequences[s]))
+    order = [first] + [s for s in range(3) if s != first]
+    x, y, z = (np.array(dna2int(sequences[s]), dtype = "int") for s in order)
+    middle = len(x) // 2
+    to_middle = last_plane(x[:middle], y, z)
+    from_middle = last_plane(x[middle:][::-1], y[::-1], z[::-1])[::-1, ::-1]
+    j, k = np.unravel_index(np.argmin(to_middle + from_middle), to_middle.shape)
+    parts = [(0, middle, 0, j, 0, k), (middle, len(x), j, len(y), k, len(z))]
+    rows = [""]*3
+    for x0, x1, y0, y1, z0, z1 in parts:
+        part = [sequences[order[0]][x0:x1], sequences[order[1]][y0:y1], sequences[order[2]][z0:z1]]
+        aligned = divide_and_conquer(*part).sequences
+        for s, row in zip(order, aligned):
+            rows[s] += row
+    return MSA(int(to_middle[j, k] + from_middle[j, k]), tuple(rows))
+
 def find_first_sequence(sequences: [str])-> int:
     """
     Finds the first sequence for 2-approximation algorithm
@@ -145,6 +304,50 @@ def find_first_sequence(sequences: [str])-> int:
         pairwises[i, j] = pairwises[j, i] = global_alignment(sequences[i], sequences[j]).cost
     return np.argmin([sum(row) for row in pairwises])   
 
+def as_codes(sequences: Tuple[str])-> np.ndarray:
+    """Aligned sequences as rows of uint8 character codes"""
+    return np.frombuffer("".join(sequences).encode(), dtype = np.uint8).reshape(len(sequences), -1)
+
+def merge_alignments(*blocks: np.ndarray)-> np.ndarray:
+    """
+    Merge alignments of uint8 codes whose first rows align the same center
+    sequence into one MSA, the center and then the other rows of each
+    block. Between two center characters, the merged MSA has as many gap
+    columns as the block with the most; each block fills the first of
+    them. So the positions of all columns follow from the gaps in the
+    center rows, and every block is copied once into a preallocated MSA.
+    >>> merge_alignments(as_codes(("A-C", "AGC")), as_codes(("AC-", "TCA"))).view("S1")
+    array([[b'A', b'-', b'C', b'-'],
+           [b'A', b'G', b'C', b'-'],
+           [b'T', b'-', b'C', b'A']], dtype='|S1')
+    """
+    gap = ord("-")
+    center = blocks[0][0][blocks[0][0] != gap]
+    # Gap columns of each block in each slot, before each center character
+    width = np.zeros(len(center) + 1, dtype = "int")
+    slots = []
+    for block in blocks:
+        residue = block[0] != gap
+        if not np.array_equal(block[0][residue], center):
+            raise ValueError("The alignments have different centers")
+        slot = np.cumsum(residue) - residue
+        counts = np.bincount(slot[~residue], minlength = len(center) + 1)
+        np.maximum(width, counts, out = width)
+        slots.append((residue, slot, counts))
+    position = np.arange(len(center) + 1) + np.cumsum(width)
+    start = position - width
+    msa = np.full((1 + sum(len(block) - 1 for block in blocks), len(center) + width.sum()), gap, dtype = np.uint8)
+    msa[0, position[:-1]] = center
+    row = 1
+    for block, (residue, slot, counts) in zip(blocks, slots):
+        columns = np.empty(block.shape[1], dtype = "int")
+        columns[residue] = position[slot[residue]]
+        gaps = slot[~residue]
+        columns[~residue] = start[gaps] + np.arange(len(gaps)) - (np.cumsum(counts) - counts)[gaps]
+        msa[row : row + len(block) - 1, columns] = block[1:]
+        row += len(block) - 1
+    return msa
+
 def extend_MSA(M: np.ndarray , A: MSA) -> np.ndarray:
     """
     Extend a MSA with a given pairwise alignment. 
@@ -155,52 +358,116 @@ def extend_MSA(M: np.ndarray , A: MSA) -> np.ndarray:
            ['A', '-'],
            ['G', 'C']], dtype='<U1')
     """
-    A = A.sequences
-    new_msa = np.empty((M.shape[0]+1, 0), dtype = "<U1")
-    i, j = 0, 0
-    while i < M.shape[1] and j < len(A[0]):
-        if M[0, i] == A[0][j]:
-            new_column =  np.append(M[:, i], A[1][j])
-            new_column = new_column.reshape((len(new_column),1))
-            new_msa = np.hstack((new_column, new_msa))
-            i+=1
-            j+=1
-        elif M[0, i] == "-":
-            new_column =  np.append(M[:, i], "-")
-            new_column = new_column.reshape((len(new_column),1))
-            new_msa = np.hstack((new_column, new_msa))
-            i+=1
-        elif A[0][j] == "-":
-            new_column =  np.append(M.shape[0]*["-"], A[1][j])
-            new_column = new_column.reshape((len(new_column),1))
-            new_msa = np.hstack((new_column, new_msa))
-            j+=1
-    while i < M.shape[1]:
-        new_column =  np.append(M[:, i], "-")
-        new_column = new_column.reshape((len(new_column),1))
-        new_msa = np.hstack((new_column, new_msa))
-        i+=1
-    while j < len(A[0]):
-        new_column =  np.append(M.shape[0]*["-"], A[1][j])
-        new_column = new_column.reshape((len(new_column),1))
-        new_msa = np.hstack((new_column, new_msa))
-        j+=1
-    return  np.flip(new_msa, 1)
-
-def compute_2P_approximation(*sequences)-> np.ndarray:
+    M = M.astype("S1").view(np.uint8)
+    return merge_alignments(M, as_codes(A.sequences)).view("S1").astype("<U1")
+
+def compute_2P_approximation(*sequences)-> MSA:
+    """
+    Center-star alignment, at most twice as costly as an optimal one: the
+    pairwise alignments of the center with the other sequences are merged
+    in one pass. The rows are the center and then the other sequences,
+    last first.
+    >>> compute_2P_approximation("AC", "GC", "AAC")
+    MSA(cost=14, sequences=('A-C', 'AAC', 'G-C'))
+    """
+    if len(sequences) < 2:
+        return MSA(cost = 0, sequences = tuple(sequences))
     first = find_first_sequence(sequences)
     alignments = list()
     for second, _ in enumerate(sequences):
         if second != first:
             alignments.append(global_alignment(sequences[first], sequences[second]))
-    MultipleAligment = np.array([ list(seq) for seq in alignments.pop().sequences]) 
-    while alignments:
-        pairwise = alignments.pop()
-        MultipleAligment = extend_MSA(MultipleAligment, pairwise)
-    cost = sum(score_sum_pairs(*[dna2int(char) for char in col]) for col in MultipleAligment.T)
-    aligned_sequences = tuple("".join(x) for x in MultipleAligment)
-    return MSA(cost = int(cost), sequences = aligned_sequences)
-  
+    MultipleAligment = merge_alignments(*(as_codes(alignment.sequences) for alignment in reversed(alignments)))
+    aligned_sequences = tuple(row.tobytes().decode() for row in MultipleAligment)
+    return MSA(cost = score_msa(*aligned_sequences), sequences = aligned_sequences)
+
+def suffix_costs(a: str, b: str)-> np.ndarray:
+    """Costs of optimal alignments of all pairs of suffixes a[i:] and b[j:], by the pairwise DP
+    >>> int(suffix_costs("AATAAT", "AAGG")[0, 0])
+    14
+    """
+    return compute_exact_alignment(a[::-1], b[::-1])[::-1, ::-1]
+
+def carrillo_lipman(*sequences: str, upper_bound: Optional[int] = None)-> MSA:
+    """
+    Optimal alignment of 3 sequences, filling only the cells that can be on
+    an optimal path (Carrillo-Lipman). The cost of any alignment of the
+    suffixes after a cell is at least the sum h of the optimal pairwise
+    costs of the suffixes, so a cell whose cost D plus h exceeds an upper
+    bound (by default the cost of the 2-approximation) is dropped. The
+    planes of equal index sum are filled in order as in
+    compute_exact_alignment, but only for the successors of cells kept in
+    the planes before, and only the cells kept are stored, sorted by their
+    flat index.
+    >>> carrillo_lipman("GTTCCGAAAGGCTAGCGCTAGGCGCC", "ATGGATTTATCTGCTCTTCG", "TGCATGCTGAAACTTCTCAACCA").cost
+    198
+    >>> carrillo_lipman("AATAAT", "AAGG", "AG", upper_bound = 10)
+    Traceback (most recent call last):
+        ...
+    ValueError: No alignment costs at most the upper bound 10
+    """
+    if upper_bound is None:
+        upper_bound = compute_2P_approximation(*sequences).cost
+    x, y, z = sequences
+    shape = tuple(len(sequence) + 1 for sequence in sequences)
+    # Lower bounds of the costs from each cell to the end, by pairs of indexes
+    xy, xz, yz = suffix_costs(x, y), suffix_costs(x, z), suffix_costs(y, z)
+    strides = np.array([shape[1]*shape[2], shape[2], 1])
+    moves = get_moves(3)
+    offsets, steps = moves @ strides, moves.sum(axis = 1)
+    costs = get_column_costs(3).reshape(-1)
+    weights = len(ALPHABET) ** np.arange(2, -1, -1)
+    gaps = GAP_CHAR * weights.sum()
+    codes = [np.array(dna2int(sequence) + [GAP_CHAR], dtype = "int") for sequence in sequences]
+    infinity = np.iinfo(np.int64).max // 2
+    # Kept cells and their costs, by plane
+    cells, values = [np.zeros(1, dtype = np.int64)], [np.zeros(1, dtype = np.int64)]
+    for plane in range(1, sum(shape) - 2):
+        successors = []
+        for move, offset, step in zip(moves, offsets, steps):
+            if step <= plane:
+                index = np.unravel_index(cells[plane - step], shape)
+                inside = np.all([i + m < n for i, m, n in zip(index, move, shape)], axis = 0)
+                successors.append(cells[plane - step][inside] + offset)
+        candidates = np.unique(np.concatenate(successors))
+        index = np.array(np.unravel_index(candidates, shape))
+        chars = np.array([code[i - 1] for code, i in zip(codes, index)])
+        columns = gaps + moves @ ((chars - GAP_CHAR) * weights[:, None])
+        best = np.full(len(candidates), infinity, dtype = np.int64)
+        for move, offset, step, column in zip(moves, offsets, steps, columns):
+            if step > plane or not len(cells[plane - step]):
+                continue
+            previous = candidates - offset
+            found = np.searchsorted(cells[plane - step], previous).clip(max = len(cells[plane - step]) - 1)
+            found_cost = values[plane - step][found] + costs[column]
+            hit = (cells[plane - step][found] == previous) & np.all(index >= move[:, None], axis = 0)
+            best = np.where(hit, np.minimum(best, found_cost), best)
+        bound = best + xy[index[0], index[1]] + xz[index[0], index[2]] + yz[index[1], index[2]]
+        keep = bound <= upper_bound
+        cells.append(candidates[keep])
+        values.append(best[keep])
+    # Backtrack through the kept cells
+    index, plane = np.array(shape) - 1, sum(shape) - 3
+    if not len(values[plane]):
+        raise ValueError(f"No alignment costs at most the upper bound {upper_bound}")
+    cost = int(values[plane][0])
+    aligned = []
+    while plane:
+        current = values[plane][np.searchsorted(cells[plane], index @ strides)]
+        for move, step in zip(moves, steps):
+            previous = index - move
+            if step > plane or np.any(previous < 0):
+                continue
+            at = np.searchsorted(cells[plane - step], previous @ strides)
+            column = [code[i - 1] if m else GAP_CHAR for code, i, m in zip(codes, index, move)]
+            if (at < len(cells[plane - step]) and cells[plane - step][at] == previous @ strides
+                    and values[plane - step][at] + score_sum_pairs(*column) == current):
+                aligned.append(column)
+                index, plane = previous, plane - step
+                break
+    aligned = np.array(aligned[::-1], dtype = "int").reshape(-1, 3)
+    return MSA(cost, tuple(int2dna(row.tolist()) for row in aligned.T))
+
 if __name__=='__main__':
     import time
     import psutil
@@ -0,0 +1,27 @@
+import argparse
+import sys
+from rfdist import SplitCounter, read_newick
+from rfmatrix import tree_files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Split frequencies of Newick trees: consensus tree or support of a tree")
+    parser.add_argument("trees", nargs="+", help="(multi-tree) Newick files, or directories of them")
+    parser.add_argument("--pattern", default="*.newick", help="Newick files to read in directories")
+    parser.add_argument("--threshold", type=float, default=0.5, help="smallest frequency (exclusive) of consensus splits")
+    parser.add_argument("--capacity", type=int, help="largest number of splits counted at once (default: no limit)")
+    parser.add_argument("--support", help="Newick file of a tree to label with the split frequencies instead")
+    parser.add_argument("-o", "--output", help="Newick file (default: stdout)")
+    args = parser.parse_args()
+    counter = SplitCounter(args.capacity)
+    for file in tree_files(args.trees, args.pattern):
+        counter.update(read_newick(file))
+    if counter.error:
+        print(f"Split counts may be up to {counter.error} too high", file=sys.stderr)
+    if args.support:
+        tree = next(read_newick(args.support))
+        newick = tree.newick(counter.support(tree))
+    else:
+        newick = counter.consensus(args.threshold).newick()
+    with open(args.output, "w") if args.output else sys.stdout as f:
+        print(newick, file=f)
@@ -1,5 +1,111 @@
+import argparse
 import sys
-from Bio import AlignIO
-infile = sys.argv[1]
-align = AlignIO.read(infile, 'fasta')
-print(format(align, "stockholm"))
\ No newline at end of file
+from array import array
+from bisect import bisect_right
+from contextlib import nullcontext
+from typing import BinaryIO, List, Optional, TextIO
+
+WHITESPACE = b" \t\r\n"
+
+
+def cut_fields(header: bytes, fields: Optional[int]) -> bytes:
+    """header without its fields after the first fields '|'-separated ones, as `cut -d '|' -f-FIELDS`"""
+    if fields is None or b"|" not in header:
+        return header
+    return b"|".join(header.rstrip(b"\r\n").split(b"|")[:fields]) + b"\n"
+
+
+class FastaIndex:
+    """
+    Where the sequences of a FASTA file are, found in one pass without
+    keeping them: the name and description of every record (from its header
+    cut after fields fields) and, for each of its sequence lines, the offset
+    in the file and the number of columns before it. With fasta, the file is
+    also copied there with the cut headers.
+    """
+
+    def __init__(self, file: BinaryIO, fields: Optional[int] = None, fasta: Optional[BinaryIO] = None):
+        self.names: List[str] = []
+        self.descriptions: List[str] = []
+        self.starts: List[array] = []
+        self.columns: List[array] = []
+        self.lengths: List[int] = []
+        offset = 0
+        for line in file:
+            size = len(line)
+            if line.startswith(b">"):
+                line = cut_fields(line, fields)
+                title = line[1:].decode().rstrip()
+                self.names.append(title.split(None, 1)[0] if title else "")
+                self.descriptions.append(title)
+                self.starts.append(array("q"))
+                self.columns.append(array("q"))
+                self.lengths.append(0)
+            elif self.names:
+                sequence = line.rstrip(WHITESPACE)
+                if len(sequence.translate(None, WHITESPACE)) != len(sequence):
+                    raise ValueError(f"Whitespace inside a sequence line of {self.names[-1]}")
+                if sequence:
+                    self.starts[-1].append(offset)
+                    self.columns[-1].append(self.lengths[-1])
+                    self.lengths[-1] += len(sequence)
+            if fasta is not None:
+                fasta.write(line)
+            offset += size
+
+    def read(self, file: BinaryIO, record: int, begin: int, end: int) -> bytes:
+        """Columns begin to end of the sequence of record, read from file"""
+        starts, columns = self.starts[record], self.columns[record]
+        first, last = bisect_right(columns, begin) - 1, bisect_right(columns, end - 1) - 1
+        start, stop = starts[first] + begin - columns[first], starts[last] + end - columns[last]
+        file.seek(start)
+        return file.read(stop - start).translate(None, WHITESPACE)
+
+
+def write_stockholm(file: BinaryIO, index: FastaIndex, out: TextIO, block: int = 10000):
+    """
+    Alignment of the indexed FASTA file in Stockholm format, written in
+    blocks of block columns, one sequence at a time, so only one block of
+    one sequence is in memory. Per-sequence markup is written as by
+    Biopython, below the sequences of the first block.
+    """
+    names = [name.replace(" ", "_") for name in index.names]
+    if not names:
+        raise ValueError("Must have at least one sequence")
+    length = index.lengths[0]
+    if length == 0:
+        raise ValueError("Non-empty sequences are required")
+    if any(other != length for other in index.lengths):
+        raise ValueError("Sequences must all be the same length")
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicate record identifier")
+    out.write("# STOCKHOLM 1.0\n")
+    out.write("#=GF SQ %i\n" % len(names))
+    for begin in range(0, length, block):
+        end = min(begin + block, length)
+        if begin:
+            out.write("\n")
+        for record, name in enumerate(names):
+            out.write(f"{name} {index.read(file, record, begin, end).decode()}\n")
+            if begin == 0:
+                if index.names[record]:
+                    out.write(f"#=GS {name} AC {index.names[record]}\n")
+                if index.descriptions[record]:
+                    out.write(f"#=GS {name} DE {index.descriptions[record]}\n")
+    # A blank line after the end marker, as print(format(alignment, "stockholm"))
+    out.write("//\n\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a FASTA alignment to Stockholm format, streamed in column blocks")
+    parser.add_argument("fasta", help="aligned FASTA file")
+    parser.add_argument("--fields", type=int, help="keep only this many '|'-separated fields of the headers")
+    parser.add_argument("--truncated", help="also write the FASTA file with the cut headers here")
+    parser.add_argument("--block", type=int, default=10000, help="number of columns per block")
+    parser.add_argument("-o", "--output", help="Stockholm file (default: stdout)")
+    args = parser.parse_args()
+    with open(args.fasta, "rb") as file:
+        with open(args.truncated, "wb") if args.truncated else nullcontext() as fasta:
+            index = FastaIndex(file, args.fields, fasta)
+        with open(args.output, "w") if args.output else sys.stdout as out:
+            write_stockholm(file, index, out, args.block)
@@ -0,0 +1,110 @@
+import argparse
+import sys
+import numpy as np
+from fasta2stock import FastaIndex
+from nj import PhaseTimer, neighbor_joining
+
+GAP = ord("-")
+# Above this many cells the residues are compared as packed bits, which
+# takes 1/32 of the memory of the float32 indicator matrices
+PACKED_CELLS = 2**26
+# Proteins this different are saturated: Kimura's correction is undefined
+# from p = 0.854 on, so larger p are treated as 0.85
+SATURATION = 0.85
+
+
+def read_alignment(file: str, fields: int = None) -> tuple[np.ndarray, list[str]]:
+    """Aligned sequences of a FASTA file as rows of uint8 (upper case, '.' as '-') and their names"""
+    with open(file, "rb") as f:
+        index = FastaIndex(f, fields)
+        length = index.lengths[0] if index.lengths else 0
+        if any(other != length for other in index.lengths):
+            raise ValueError("Sequences must all be the same length")
+        S = np.empty((len(index.names), length), dtype=np.uint8)
+        for record in range(len(index.names)):
+            S[record] = np.frombuffer(index.read(f, record, 0, length).upper().replace(b".", b"-"), dtype=np.uint8)
+    return S, index.names
+
+
+def _packed_counts(A: np.ndarray, block: int = 2**22) -> np.ndarray:
+    """A @ A.T for a boolean matrix A, by popcounts of its rows packed in 64-bit words"""
+    words = np.packbits(A, axis=1)
+    words = np.pad(words, ((0, 0), (0, -words.shape[1] % 8))).view(np.uint64)
+    n, width = words.shape
+    counts = np.empty((n, n), dtype=np.int64)
+    rows = max(1, block // max(n * width, 1))
+    for a in range(0, n, rows):
+        both = words[a : a + rows, None, :] & words[None, :, :]
+        counts[a : a + rows] = np.bitwise_count(both).sum(axis=2)
+    return counts
+
+
+def pair_counts(S: np.ndarray, packed: bool = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Number of columns where both sequences of a pair have a residue, and
+    where they have the same one, as n x n matrices. Each is a sum of
+    products of indicator matrices, one per residue: as float32 BLAS
+    products (exact below 2^24 columns), or with packed bits for large
+    alignments (by default above PACKED_CELLS cells).
+    """
+    if packed is None:
+        packed = S.size > PACKED_CELLS
+    residues = S != GAP
+    letters = np.unique(S[residues])
+    if packed:
+        valid = _packed_counts(residues)
+        same = sum(_packed_counts(S == letter) for letter in letters)
+    else:
+        R = residues.astype(np.float32)
+        valid = (R @ R.T).astype(np.int64)
+        same = np.zeros_like(valid)
+        for letter in letters:
+            R = (S == letter).astype(np.float32)
+            same += (R @ R.T).astype(np.int64)
+    return valid, same
+
+
+def distance_matrix(S: np.ndarray, correction: str = "kimura", packed: bool = None) -> np.ndarray:
+    """
+    Pairwise distances of aligned sequences: the fraction p of differing
+    residues over the columns where both have one, corrected as by Kimura
+    for proteins, -ln(1 - p - 0.2 p^2), unless correction is "none". Pairs
+    without shared columns are as far apart as saturated pairs.
+    """
+    valid, same = pair_counts(S, packed)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = np.where(valid > 0, 1 - same / valid, SATURATION if correction == "kimura" else 1.0)
+    if correction == "kimura":
+        p = np.minimum(p, SATURATION)
+        D = -np.log(1 - p - 0.2 * p * p)
+    else:
+        D = p
+    np.fill_diagonal(D, 0)
+    return D
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Neighbor-joining tree of an aligned FASTA file, without a distance file")
+    parser.add_argument("fasta", help="aligned FASTA file")
+    parser.add_argument("--fields", type=int, help="keep only this many '|'-separated fields of the names")
+    parser.add_argument(
+        "--correction",
+        choices=["kimura", "none"],
+        default="kimura",
+        help="Kimura's protein correction of the p-distances, or the p-distances",
+    )
+    parser.add_argument(
+        "--packed",
+        action=argparse.BooleanOptionalAction,
+        help="compare residues as packed bits (default: for large alignments)",
+    )
+    parser.add_argument("--search", choices=["dense", "sorted"], default="sorted", help="as in nj.py")
+    args = parser.parse_args()
+    timer = PhaseTimer()
+    with timer.phase("parse"):
+        S, names = read_alignment(args.fasta, args.fields)
+    with timer.phase("distances"):
+        D = distance_matrix(S, args.correction, args.packed)
+    tree = neighbor_joining(D, names, args.search, overwrite=True, timer=timer)
+    print(tree.newick())
+    print(", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in timer.seconds.items()), file=sys.stderr)
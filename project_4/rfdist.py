@@ -1,60 +1,540 @@
+import re
 import sys
 from Bio import Phylo
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 # Define helper types
 Tree = Phylo.Newick.Tree
 Clade = Phylo.Newick.Clade
 
-def root_at_same_leaf(T1: Tree, T2: Tree)-> Tuple[Tree, Tree]:
-    # Find the node where to root the tree
-    root1 = T1.get_terminals()[0] # Arbitrarily first leaf
-    root2 = next(T2.find_clades(root1.name))
-    # Set the root of the trees
-    T1.root_with_outgroup(root1)
-    T2.root_with_outgroup(root2)
-    # Remove outgroup
-    T1.collapse(root1)
-    T2.collapse(root2)
-    return (
-        T1.common_ancestor(x for x in T1.get_terminals()),
-        T2.common_ancestor(x for x in T2.get_terminals())
-    )
-
-def is_potential_split(depths: List[int])-> bool:
-    return max(depths) - min(depths) + 1 == len(depths)
-
-def rfdist(T1: Tree, T2: Tree)-> int:
-    size_T1, size_T2 = len(T1.get_terminals()), len(T1.get_terminals())
+
+class ArrayTree:
+    """
+    Unrooted tree kept in arrays: neighbours[v] lists the nodes adjacent to
+    node v and names[v] is the name of a leaf (None for internal nodes).
+    Internal nodes with one neighbour are removed and those with two are
+    contracted, so every internal node left has degree three or more.
+    Nodes are numbered in preorder of the input rooting, and lengths[v] and
+    support[v] belong to the branch from v to its one smaller neighbour
+    (its parent); labels[v] is the name of an internal node.
+    """
+
+    def __init__(
+        self,
+        neighbours: List[List[int]],
+        names: List[Optional[str]],
+        lengths: Optional[List[Optional[float]]] = None,
+        support: Optional[List[Optional[float]]] = None,
+        labels: Optional[List[Optional[str]]] = None,
+    ):
+        self.neighbours = neighbours
+        self.names = names
+        self.lengths = lengths or [None] * len(names)
+        self.support = support or [None] * len(names)
+        self.labels = labels or [None] * len(names)
+        work = [v for v, name in enumerate(names) if name is None]
+        while work:
+            v = work.pop()
+            adjacent = neighbours[v]
+            if len(adjacent) == 1:
+                neighbours[adjacent[0]].remove(v)
+                if names[adjacent[0]] is None:
+                    work.append(adjacent[0])
+            elif len(adjacent) == 2:
+                a, b = sorted(adjacent)
+                neighbours[a][neighbours[a].index(v)] = b
+                neighbours[b][neighbours[b].index(v)] = a
+                # The merged branch a-b is kept on b, the larger of the two;
+                # if v was the root, a becomes the root
+                near, far = self.lengths[max(a, v)], self.lengths[b]
+                if near is not None or far is not None:
+                    self.lengths[b] = (near or 0.0) + (far or 0.0)
+                if self.support[b] is None:
+                    self.support[b] = self.support[max(a, v)]
+                if a > v:
+                    self.lengths[a] = self.support[a] = None
+            else:
+                continue
+            adjacent.clear()
+        self.leaves = [v for v, name in enumerate(names) if name is not None]
+
+    @classmethod
+    def from_biopython(cls, tree: Tree) -> "ArrayTree":
+        """Array tree of a Biopython tree or clade, built without recursion"""
+        root = tree.root if isinstance(tree, Phylo.BaseTree.Tree) else tree
+        neighbours, names, lengths, support, labels = [], [], [], [], []
+        stack = [(root, -1)]
+        while stack:
+            clade, parent = stack.pop()
+            node = len(names)
+            neighbours.append([] if parent < 0 else [parent])
+            names.append(clade.name if clade.is_terminal() else None)
+            labels.append(None if clade.is_terminal() else clade.name)
+            lengths.append(clade.branch_length)
+            support.append(clade.confidence)
+            if parent >= 0:
+                neighbours[parent].append(node)
+            stack.extend((child, node) for child in reversed(clade.clades))
+        return cls(neighbours, names, lengths, support, labels)
+
+    def leaf(self, name: str) -> int:
+        return next(v for v in self.leaves if self.names[v] == name)
+
+    @property
+    def root(self) -> int:
+        """The node without a smaller neighbour"""
+        return next((v for v, name in enumerate(self.names) if name is not None or self.neighbours[v]), 0)
+
+    def newick(self, support: Optional[List[Optional[float]]] = None) -> str:
+        """
+        Newick string of the tree in its input rooting, built without
+        recursion. Internal nodes are labelled with their support (or with
+        support[v] if given), otherwise with their name.
+        """
+        support = self.support if support is None else support
+        root = self.root
+        out, stack = [], [root]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                out.append(item)
+                continue
+            children = [w for w in self.neighbours[item] if w > item]
+            if children:
+                out.append("(")
+                label = self.labels[item] if support[item] is None else "%1.2f" % support[item]
+            else:
+                label = self.names[item]
+            if label and not UNQUOTED_LABEL.fullmatch(label):
+                label = "'%s'" % label.replace("'", "''")
+            if self.lengths[item] is not None and item != root:
+                label = (label or "") + ":%1.8g" % self.lengths[item]
+            if children:
+                stack.append(")" + (label or ""))
+                for k in reversed(range(len(children))):
+                    stack.append(children[k])
+                    if k:
+                        stack.append(",")
+            else:
+                out.append(label or "")
+        return "".join(out) + ";"
+
+    def rooted_at(self, leaf: int) -> Tuple[List[int], List[int]]:
+        """Nodes in depth-first preorder and their parents when rooted at leaf"""
+        order, parent = [], [-1] * len(self.names)
+        stack = [leaf]
+        while stack:
+            v = stack.pop()
+            order.append(v)
+            children = [w for w in self.neighbours[v] if w != parent[v]]
+            for w in children:
+                parent[w] = v
+            stack.extend(reversed(children))
+        return order, parent
+
+
+# Labels written without quotes in Newick, as in Biopython
+UNQUOTED_LABEL = re.compile(r"[^\s\(\)\[\]\'\:\;\,]+")
+
+# Newick tokens: quoted label, comment, punctuation, unquoted label or
+# any other (invalid) character
+NEWICK_TOKEN = re.compile(r"\s*(?:('(?:[^']|'')*'(?!'))|(\[[^\]]*\])|([(),:;])|([^\s(),:;\[\]']+)|(\S))")
+COMMENT, INVALID = 2, 5
+# Tokens of text without quotes or comments, the common case
+PLAIN_TOKEN = re.compile(r"[(),:;]|[^\s(),:;\[\]']+")
+
+
+def newick_tokens(chunks: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Tokens of Newick text given in chunks of any size, in one list per
+    chunk. A token cut by the end of a chunk is completed with the next
+    one; comments are dropped.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if "'" not in buffer and "[" not in buffer:
+            # Up to the last punctuation, no token can continue
+            position = max(map(buffer.rfind, "(),:;")) + 1
+            yield PLAIN_TOKEN.findall(buffer, 0, position)
+            buffer = buffer[position:]
+            continue
+        tokens, position = [], 0
+        for match in NEWICK_TOKEN.finditer(buffer):
+            # The last token, or an unterminated quote or comment, may
+            # continue in the next chunk
+            if match.end() == len(buffer) or match.lastindex == INVALID:
+                break
+            position = match.end()
+            if match.lastindex != COMMENT:
+                tokens.append(match[match.lastindex])
+        buffer = buffer[position:]
+        yield tokens
+    tokens = []
+    for match in NEWICK_TOKEN.finditer(buffer):
+        if match.lastindex == INVALID:
+            raise ValueError(f"Invalid Newick text: {buffer[match.start():match.start() + 50]!r}")
+        if match.lastindex != COMMENT:
+            tokens.append(match[match.lastindex])
+    yield tokens
+
+
+def newick_trees(chunks: Iterable[str]) -> Iterator[ArrayTree]:
+    """
+    Trees of Newick text given in chunks, parsed one at a time without
+    recursion. Labels after a closing parenthesis are support values if
+    they are numbers, otherwise names of internal nodes.
+    """
+    # Branch lengths, support values and internal names by node
+    parent, names, lengths, support, labels = [], [], {}, {}, {}
+    stack = []
+    # Last node completed, whether a new child or a branch length is expected
+    current, expect, length = -1, True, False
+    for tokens in newick_tokens(chunks):
+        for token in tokens:
+            if length:
+                lengths[current] = float(token)
+                length = False
+            elif token == "(":
+                parent.append(stack[-1] if stack else -1)
+                names.append(None)
+                stack.append(len(parent) - 1)
+                current, expect = -1, True
+            elif token == "," or token == ")" or token == ";" or token == ":":
+                if expect and (token != ";" or not parent):
+                    # A leaf without a name
+                    parent.append(stack[-1] if stack else -1)
+                    names.append("")
+                    current, expect = len(parent) - 1, False
+                if token == ",":
+                    current, expect = -1, True
+                elif token == ")":
+                    if not stack:
+                        raise ValueError("Unbalanced parentheses in Newick text")
+                    current = stack.pop()
+                elif token == ":":
+                    length = True
+                else:
+                    if stack:
+                        raise ValueError("Unbalanced parentheses in Newick text")
+                    neighbours = [[] for _ in parent]
+                    for v, p in enumerate(parent):
+                        if p >= 0:
+                            neighbours[v].append(p)
+                            neighbours[p].append(v)
+                    nodes = range(len(parent))
+                    yield ArrayTree(
+                        neighbours,
+                        names,
+                        [lengths.get(v) for v in nodes],
+                        [support.get(v) for v in nodes],
+                        [labels.get(v) for v in nodes],
+                    )
+                    parent, names, lengths, support, labels = [], [], {}, {}, {}
+                    current, expect = -1, True
+            else:
+                label = token[1:-1].replace("''", "'") if token[0] == "'" else token
+                if expect:
+                    parent.append(stack[-1] if stack else -1)
+                    names.append(label)
+                    current, expect = len(parent) - 1, False
+                else:
+                    try:
+                        support[current] = float(label)
+                    except ValueError:
+                        labels[current] = label
+    if parent:
+        raise ValueError("Newick text does not end with ';'")
+
+
+def read_newick(file: str, chunk_size: int = 2**20) -> Iterator[ArrayTree]:
+    """Stream the trees of a (multi-tree) Newick file"""
+    with open(file) as f:
+        yield from newick_trees(iter(lambda: f.read(chunk_size), ""))
+
+
+def as_array_tree(tree) -> ArrayTree:
+    return tree if isinstance(tree, ArrayTree) else ArrayTree.from_biopython(tree)
+
+
+def intervals(tree: ArrayTree, order: List[int], parent: List[int], numbers: dict) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Smallest and largest number and number of leaves below every node of
+    tree rooted as given by order and parent, in one post-order pass.
+    """
+    nodes = len(tree.names)
+    low, high, size = [nodes] * nodes, [-1] * nodes, [0] * nodes
+    for v in reversed(order[1:]):
+        name = tree.names[v]
+        if name is not None:
+            low[v] = high[v] = numbers[name]
+            size[v] = 1
+        p = parent[v]
+        low[p] = min(low[p], low[v])
+        high[p] = max(high[p], high[v])
+        size[p] += size[v]
+    return low, high, size
+
+
+class LeafOrder:
+    """
+    Read-only index of a tree for rfdist: the tree rooted at the leaf
+    outgroup (by default its first leaf), the depth-first numbers of the
+    other leaves, and the DF-intervals of its clusters in Day's table: an
+    interval is stored at its right end if its node is the first child of
+    its parent, otherwise at its left end, so no two collide. An index can
+    be compared against any number of trees or indexes without copies.
+    """
+
+    def __init__(self, tree, outgroup: Optional[str] = None):
+        self.tree = as_array_tree(tree)
+        leaves = self.tree.leaves
+        if outgroup is None and leaves:
+            outgroup = self.tree.names[leaves[0]]
+        self.outgroup = outgroup
+        if not leaves:
+            self.order, self.parent, self.numbers, self.splits = (), (), {}, 0
+            return
+        order, parent = self.tree.rooted_at(self.tree.leaf(self.outgroup))
+        self.order, self.parent = tuple(order), tuple(parent)
+        names = (self.tree.names[v] for v in order[1:] if self.tree.names[v] is not None)
+        self.numbers = {name: num + 1 for num, name in enumerate(names)}
+        low, high, _ = intervals(self.tree, order, parent, self.numbers)
+        at_left, at_right = [0] * (len(leaves) + 1), [0] * (len(leaves) + 1)
+        first_child = {}
+        self.splits = 0
+        for v in order[1:]:
+            first_child.setdefault(parent[v], v)
+            if self.tree.names[v] is None:
+                self.splits += 1
+                if first_child[parent[v]] == v:
+                    at_right[high[v]] = low[v]
+                else:
+                    at_left[low[v]] = high[v]
+        self.at_left, self.at_right = tuple(at_left), tuple(at_right)
+
+    def rooted_at(self, outgroup: str) -> Tuple[List[int], List[int]]:
+        """Preorder and parents of the tree rooted at outgroup, reused if possible"""
+        if outgroup == self.outgroup:
+            return self.order, self.parent
+        return self.tree.rooted_at(self.tree.leaf(outgroup))
+
+    def is_cluster(self, low: int, high: int) -> bool:
+        return self.at_left[low] == high or self.at_right[high] == low
+
+
+def rfdist(T1, T2)-> int:
+    """
+    Robinson-Foulds distance between two trees (Biopython trees, ArrayTree
+    or LeafOrder) with Day's algorithm, in time linear in the number of
+    leaves. The trees are not modified.
+    """
+    A = T1 if isinstance(T1, LeafOrder) else LeafOrder(T1)
+    B = T2 if isinstance(T2, LeafOrder) else as_array_tree(T2)
+    tree = B.tree if isinstance(B, LeafOrder) else B
+    size_T1, size_T2 = len(A.tree.leaves), len(tree.leaves)
     if size_T1 != size_T2:
         raise ValueError('Tree 1 and Tree 2 have different length')
     if size_T1 < 3:
         return 0
-    # Step1: Root the two input trees at the same leaf
-    T1, T2 = root_at_same_leaf(T1, T2)
-    # Step 2: Make a Depth-First numbering of the leaves in T1
-    # No need to reannotate, we can just use a dictionary
-    # and keep track of the names if we assume all headers are unique
-    depth_dict = {leaf.name : num +1 for num, leaf in enumerate(T1.get_terminals()) if leaf.name}
-    # Step 3:
-    # Annotate internal nodes in T1 with DF-intervals
-    intervals = set()
-    for clade in T1.get_nonterminals():
-        depths = [depth_dict[leaf.name] for leaf in clade.get_terminals() if leaf.name]
-        intervals.add((min(depths), max(depths)))
+    # Step 1, 2 and 3: T1 rooted at a leaf, its leaves numbered depth-first
+    # and its intervals in Day's table, all in the index A
     # Step 4
-    # Count the number of shared splits'
-    shared = 0
-    for clade in T2.get_nonterminals():
-        depths = [depth_dict[leaf.name] for leaf in clade.get_terminals() if leaf.name]
-        if is_potential_split(depths) and (min(depths), max(depths)) in intervals:
-            shared+=1
+    # Count the number of shared splits', with T2 rooted at the same leaf
+    if isinstance(B, LeafOrder):
+        order, parent = B.rooted_at(A.outgroup)
+    else:
+        order, parent = tree.rooted_at(tree.leaf(A.outgroup))
+    low, high, size = intervals(tree, order, parent, A.numbers)
+    splits_T2, shared = 0, 0
+    for v in order[1:]:
+        if tree.names[v] is None:
+            splits_T2 += 1
+            if high[v] - low[v] + 1 == size[v] and A.is_cluster(low[v], high[v]):
+                shared += 1
     #“number of splits in T1 and T2” - 2 * shared
-    return len(intervals)*2 - 2*shared
-    
+    return A.splits + splits_T2 - 2*shared
+
+
+def taxon_index(trees: List[ArrayTree]) -> dict:
+    """Shared numbering of the taxa of trees, which must all have the same taxa"""
+    names = sorted(trees[0].names[v] for v in trees[0].leaves) if trees else []
+    for tree in trees[1:]:
+        if sorted(tree.names[v] for v in tree.leaves) != names:
+            raise ValueError('The trees have different taxa')
+    return {name: num for num, name in enumerate(names)}
+
+
+def node_splits(tree: ArrayTree, taxa: dict) -> dict:
+    """
+    Non-trivial splits of tree as bitsets over taxa, by the internal node
+    below the split's branch. The tree is rooted at taxon 0, so each split
+    is the side without taxon 0 and equal splits of different trees have
+    equal (hashable) integers.
+    """
+    if len(taxa) < 4:
+        return {}
+    leaf = next(v for v in tree.leaves if taxa[tree.names[v]] == 0)
+    order, parent = tree.rooted_at(leaf)
+    bits, size = [0] * len(tree.names), [0] * len(tree.names)
+    splits = {}
+    for v in reversed(order[1:]):
+        if tree.names[v] is not None:
+            bits[v], size[v] = 1 << taxa[tree.names[v]], 1
+        elif size[v] < len(taxa) - 1:
+            splits[v] = bits[v]
+        bits[parent[v]] |= bits[v]
+        size[parent[v]] += size[v]
+    return splits
+
+
+def split_set(tree: ArrayTree, taxa: dict) -> set:
+    """Non-trivial splits of tree as bitsets over taxa (see node_splits)"""
+    return set(node_splits(tree, taxa).values())
+
+
+# Split sets shared with the worker processes of rf_matrix
+_splits = []
+
+
+def _init_matrix(splits: List[set]):
+    global _splits
+    _splits = splits
+
+
+def _matrix_row(i: int) -> List[int]:
+    return [len(_splits[i]) + len(_splits[j]) - 2 * len(_splits[i] & _splits[j]) for j in range(i + 1, len(_splits))]
+
+
+def rf_matrix(trees: list, jobs: int = 1) -> List[List[int]]:
+    """
+    All-vs-all Robinson-Foulds distances, the size of the symmetric
+    difference of the split sets, as rfdist. The splits of every tree are
+    computed once, the rows are spread over jobs processes.
+    """
+    trees = [as_array_tree(tree) for tree in trees]
+    taxa = taxon_index(trees)
+    splits = [split_set(tree, taxa) for tree in trees]
+    if jobs > 1:
+        from multiprocessing import Pool
+        with Pool(jobs, initializer=_init_matrix, initargs=(splits,)) as pool:
+            rows = pool.map(_matrix_row, range(len(trees)))
+    else:
+        _init_matrix(splits)
+        rows = [_matrix_row(i) for i in range(len(trees))]
+    matrix = [[0] * len(trees) for _ in trees]
+    for i, row in enumerate(rows):
+        for j, dist in enumerate(row, start=i + 1):
+            matrix[i][j] = matrix[j][i] = dist
+    return matrix
+
+class SplitCounter:
+    """
+    Split frequencies of a stream of trees on the same taxa, counted in one
+    pass in a table of split bitsets. With a capacity the table is bounded:
+    when it overflows, the rarest splits are dropped and error is raised to
+    the largest count dropped. Splits counted afterwards start at error, so
+    every count is an upper bound, at most error above the true count, and
+    frequencies are the lower bounds count - error (exact if error is 0).
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity
+        self.taxa, self.names = {}, []
+        self.counts = {}
+        self.trees = 0
+        self.error = 0
+
+    def add(self, tree):
+        tree = as_array_tree(tree)
+        if not self.trees:
+            self.names = sorted(tree.names[v] for v in tree.leaves)
+            self.taxa = {name: num for num, name in enumerate(self.names)}
+        self._check_taxa(tree)
+        self.trees += 1
+        counts = self.counts
+        for split in node_splits(tree, self.taxa).values():
+            counts[split] = counts.get(split, self.error) + 1
+        if self.capacity is not None and len(counts) > self.capacity:
+            self._prune()
+
+    def update(self, trees: Iterable):
+        for tree in trees:
+            self.add(tree)
+
+    def _check_taxa(self, tree: ArrayTree):
+        names = [tree.names[v] for v in tree.leaves]
+        if len(names) != len(self.taxa) or any(name not in self.taxa for name in names):
+            raise ValueError('The trees have different taxa')
+
+    def _prune(self):
+        # Keep at most half the capacity, so pruning is rare
+        threshold = sorted(self.counts.values())[len(self.counts) - self.capacity // 2 - 1]
+        self.counts = {split: count for split, count in self.counts.items() if count > threshold}
+        self.error = max(self.error, threshold)
+
+    def frequency(self, split: int) -> float:
+        """Fraction of the trees with split (a lower bound if error > 0)"""
+        return max(self.counts.get(split, 0) - self.error, 0) / self.trees if self.trees else 0.0
+
+    def support(self, tree) -> List[Optional[float]]:
+        """
+        Frequencies of the splits of tree, on the nodes holding their
+        branches as in ArrayTree (None for the other nodes)
+        """
+        tree = as_array_tree(tree)
+        self._check_taxa(tree)
+        support = [None] * len(tree.names)
+        order, parent = tree.rooted_at(tree.leaf(self.names[0])) if self.names else ([], [])
+        for v, split in node_splits(tree, self.taxa).items():
+            support[max(v, parent[v])] = self.frequency(split)
+        return support
+
+    def consensus(self, threshold: float = 0.5) -> ArrayTree:
+        """
+        Consensus tree of the splits found in more than threshold of the
+        trees (majority rule by default), with their frequencies as support.
+        For threshold below 0.5 the splits are taken by decreasing frequency
+        and those conflicting with the ones taken are skipped (greedy).
+        """
+        n = len(self.names)
+        found = [(self.frequency(split), split) for split in self.counts]
+        found = sorted((item for item in found if item[0] > threshold), key=lambda item: -item[0])
+        # Compatible splits, each nested in or disjoint from the others
+        taken = []
+        for frequency, split in found:
+            if threshold < 0.5 and not all(
+                split & other in (0, split, other) for _, other in taken
+            ):
+                continue
+            taken.append((frequency, split))
+        taken.sort(key=lambda item: -bin(item[1]).count("1"))
+        # Node 0 is the root, then the clades from the largest, then leaves,
+        # so every node comes after its parent
+        parent, support = [-1], [None]
+        below = [0] * n
+        for frequency, split in taken:
+            members = [taxon for taxon in range(n) if split >> taxon & 1]
+            parent.append(below[members[0]])
+            support.append(frequency)
+            for taxon in members:
+                below[taxon] = len(parent) - 1
+        names = [None] * len(parent)
+        for taxon in range(n):
+            parent.append(below[taxon])
+            support.append(None)
+            names.append(self.names[taxon])
+        neighbours = [[] for _ in parent]
+        for v, p in enumerate(parent):
+            if p >= 0:
+                neighbours[v].append(p)
+                neighbours[p].append(v)
+        return ArrayTree(neighbours, names, support=support)
+
+
 if __name__ == '__main__':
     if len(sys.argv) != 3:
         sys.exit("Usage: python rfdist.py tree1.new tree2.new")
-    tree1 = Phylo.read(sys.argv[1], 'newick')
-    tree2 = Phylo.read(sys.argv[2], 'newick')
-    print(rfdist(tree1, tree2))
\ No newline at end of file
+    tree1 = next(read_newick(sys.argv[1]))
+    tree2 = next(read_newick(sys.argv[2]))
+    print(rfdist(tree1, tree2))
@@ -0,0 +1,33 @@
+import argparse
+import csv
+import sys
+from pathlib import Path
+from rfdist import read_newick, rf_matrix
+
+
+def tree_files(paths: list, pattern: str) -> list:
+    """The files given, and the files matching pattern in the directories given"""
+    files = list()
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob(pattern)) if path.is_dir() else [path])
+    return files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="All-vs-all Robinson-Foulds distances of Newick trees as CSV")
+    parser.add_argument("trees", nargs="+", help="Newick files, or directories of them")
+    parser.add_argument("--pattern", default="*.newick", help="Newick files to read in directories")
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes")
+    parser.add_argument("-o", "--output", help="CSV file (default: stdout)")
+    args = parser.parse_args()
+    trees, names = list(), list()
+    for file in tree_files(args.trees, args.pattern):
+        # Trees of multi-tree files are named stem_1, stem_2, ...
+        found = list(read_newick(file))
+        trees.extend(found)
+        names.extend([file.stem] if len(found) == 1 else [f"{file.stem}_{k}" for k in range(1, len(found) + 1)])
+    matrix = rf_matrix(trees, args.jobs)
+    with open(args.output, "w", newline="") if args.output else sys.stdout as f:
+        writer = csv.writer(f)
+        writer.writerow([""] + names)
+        writer.writerows([name] + row for name, row in zip(names, matrix))
@@ -1,5 +1,5 @@
-import subprocess
 import pandas as pd
+from rfdist import read_newick, rf_matrix
 
 SAMPLES = [
     "1347_FAINT",
@@ -18,20 +18,23 @@ SAMPLES = [
     "777_Gemini_V1",
 ]
 
+PROGRAMS = ["python", "rapidnj", "quicktree"]
+PAIRS = [(0, 1), (1, 2), (2, 0)]
+
 dists = list()
 samples_ls, files1, files2 = list(), list(), list()
 for sample in SAMPLES:
-    python = f"output/{sample}_python.newick"
-    rapidnj = f"output/{sample}_rapidnj.newick"
-    quicktree = f"output/{sample}_quicktree.newick"
-    dists.append(subprocess.check_output(["python", "rfdist.py", python, rapidnj]))
-    dists.append(subprocess.check_output(["python", "rfdist.py", rapidnj, quicktree]))
-    dists.append(subprocess.check_output(["python", "rfdist.py", quicktree, python]))
-    samples_ls.extend([sample, sample, sample])
-    files1.extend(["python", "rapidnj", "quicktree"])
-    files2.extend(["rapidnj", "quicktree", "python"])
+    trees = [
+        next(read_newick(f"output/{sample}_{program}.newick"))
+        for program in PROGRAMS
+    ]
+    matrix = rf_matrix(trees)
+    for i, j in PAIRS:
+        dists.append(matrix[i][j])
+        samples_ls.append(sample)
+        files1.append(PROGRAMS[i])
+        files2.append(PROGRAMS[j])
 
-dists = [int(x) for x in dists]
 data = {"sample": samples_ls, "file1": files1, "file2": files2, "dist": dists}
 df = pd.DataFrame(data)
 df.to_csv("distances.csv", index=False)
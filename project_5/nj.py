@@ -1,104 +1,477 @@
+import argparse
+import json
+import os
+import re
+import resource
 import sys
-import pandas as pd
+import time
+from collections import defaultdict
+from contextlib import contextmanager
 import numpy as np
-from Bio import Phylo
-from Bio.Phylo.BaseTree import Clade
 
-import resource, sys
+# Labels written without quotes in Newick, as in Biopython
+UNQUOTED_LABEL = re.compile(r"[^\s\(\)\[\]\'\:\;\,]+")
 
-resource.setrlimit(resource.RLIMIT_STACK, (2**29, -1))
-sys.setrecursionlimit(10**6)
-Tree = Phylo.Newick.Tree
-Clade = Phylo.Newick.Clade
 
+class PhaseTimer:
+    """Wall time spent in each phase of a run, accumulated over its calls"""
 
-def read_phylip_file(file: str) -> tuple[np.ndarray, list[str]]:
-    df = pd.read_csv(file, delimiter=" ", skiprows=[0], header=None)
-    cols = df.pop(0)
-    df.index = df.columns = cols
-    return df.to_numpy(), cols.to_list()
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.start = time.perf_counter()
 
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
 
-def create_start_tree(leafs: list[str]):
-    tree = Phylo.BaseTree.Tree(rooted=False)
-    for leaf in leafs:
-        tree.clade.clades.append(Phylo.BaseTree.Clade(name=leaf))
-    return tree
+    def stats(self, joins: int) -> dict:
+        """Timings, joins per second of search and update, and peak RSS in MiB"""
+        joining = self.seconds["search"] + self.seconds["update"]
+        # ru_maxrss is in bytes on macOS and in KiB elsewhere
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+        return {
+            "seconds": {**self.seconds, "total": time.perf_counter() - self.start},
+            "joins": joins,
+            "joins_per_second": joins / joining if joining else None,
+            "peak_rss_mib": rss,
+        }
 
 
-def find_neighbours(D: np.ndarray) -> tuple[int, int]:
-    val = np.inf
-    sum_rows = [sum(D[:, i]) for i in range(D.shape[0])]
-    sum_cols = [sum(D[:, j]) for j in range(D.shape[0])]
-    for i, j in np.ndindex(D.shape):
-        if i == j:
-            continue
-        N_ij = D[i, j] + (sum_rows[i] + sum_cols[j]) / (len(D) - 2)
-        if val > N_ij:
-            i_min, j_min = i, j
-            val = N_ij
-    return i_min, j_min
+class ArrayTree:
+    """
+    Tree over n leaves kept in arrays. Nodes 0, ..., n - 1 are the leaves
+    names[k], the internal nodes follow in the order add_node created them
+    and the last one is the root. children has up to three children per
+    node (-1 for none) and length the length of the branch to the parent
+    (nan if it has none).
+    """
 
+    def __init__(self, names: list[str]):
+        n = len(names)
+        self.names = names
+        self.size = n
+        self.children = np.full((2 * n, 3), -1)
+        self.parent = np.full(2 * n, -1)
+        self.length = np.full(2 * n, np.nan)
 
-def join_neighbours(D: np.ndarray, clades: list[Clade], i: int, j: int):
-    node = Clade(
-        clades=[clades.pop(max(i, j)), clades.pop(min(i, j))],
-    )
-    gamma = (D[i, j] + sum(D[:, i]) - sum(D[:, j])) / 2
-    node.clades[0].branch_length = gamma
-    node.clades[1].branch_length = D[i, j] - gamma
-    return node
+    @property
+    def root(self) -> int:
+        return self.size - 1
+
+    def add_node(self, children: list[int], lengths: list[float] = None) -> int:
+        node, self.size = self.size, self.size + 1
+        self.children[node, : len(children)] = children
+        self.parent[children] = node
+        if lengths is not None:
+            self.length[children] = lengths
+        return node
+
+    def labels(self) -> list[str]:
+        """Label and branch length of every node, formatted as by Biopython"""
+        labels = []
+        for node, length in enumerate(self.length[: self.size].tolist()):
+            label = self.names[node] if node < len(self.names) else ""
+            match = UNQUOTED_LABEL.match(label)
+            if label and (not match or match.end() < len(label)):
+                label = "'%s'" % label.replace("'", "''")
+            labels.append(label + ":%1.8g" % (0.0 if length != length else length))
+        return labels
+
+    def newick(self) -> str:
+        """Newick string of the tree, formatted as by Biopython, built without recursion"""
+        labels, children = self.labels(), self.children[: self.size].tolist()
+        out, stack = [], [self.root]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                out.append(item)
+            elif children[item][0] < 0:
+                out.append(labels[item])
+            else:
+                out.append("(")
+                stack.append(")" + labels[item])
+                kids = [child for child in children[item] if child >= 0]
+                for k in reversed(range(len(kids))):
+                    stack.append(kids[k])
+                    if k:
+                        stack.append(",")
+        return "".join(out) + ";"
+
+    def to_clade(self):
+        """The tree as a Biopython Clade, built without recursion"""
+        from Bio.Phylo.Newick import Clade
+
+        clades = [None] * self.size
+        for node in range(self.size):
+            length = None if np.isnan(self.length[node]) else float(self.length[node])
+            name = self.names[node] if node < len(self.names) else None
+            children = [clades[child] for child in self.children[node] if child >= 0]
+            clades[node] = Clade(branch_length=length, name=name, clades=children)
+        return clades[self.root]
+
+
+def read_phylip_file(
+    file: str, dtype: type = np.float64, lower: bool = False, memmap: str = None
+) -> tuple[np.ndarray, list[str]]:
+    """
+    Stream a distance matrix in phylip-format, square or lower-triangular
+    (with or without the diagonal), into a preallocated array of dtype, or
+    into the .npy file memmap. Rows may be wrapped over several lines. With
+    lower, only the lower triangle of a square matrix is parsed and mirrored.
+    """
+    with open(file) as f:
+        lines = (line for line in f if line.strip())
+        n = int(next(lines).split()[0])
+        if memmap is None:
+            D = np.zeros((n, n), dtype=dtype)
+        else:
+            D = np.lib.format.open_memmap(memmap, mode="w+", dtype=dtype, shape=(n, n))
+        names = []
+        square = wrapped = diagonal = False
+        for i in range(n):
+            name, rest = (next(lines).split(None, 1) + [""])[:2]
+            names.append(name)
+            if i == 0:
+                row = np.fromstring(rest, sep=" ")
+                diagonal = len(row) == 1 and n > 1
+                square = len(row) > 1 or n == 1
+                wrapped = square and len(row) < n
+            elif square and lower and not wrapped:
+                row = np.fromstring(rest, sep=" ", count=i)
+            else:
+                row = np.fromstring(rest, sep=" ")
+            if square:
+                expected = i if lower and not wrapped else n
+            else:
+                expected = i + diagonal
+            while len(row) < expected:
+                row = np.concatenate((row, np.fromstring(next(lines), sep=" ")))
+            if square and not lower:
+                D[i] = row[:n]
+            else:
+                D[i, :i] = row[:i]
+    if not square or lower:
+        mirror_lower_triangle(D)
+    return D, names
+
+
+def mirror_lower_triangle(D: np.ndarray, block: int = 1024):
+    """Copy the lower triangle of D to the upper one, a block of columns at a time"""
+    n = len(D)
+    for c0 in range(0, n, block):
+        c1 = min(n, c0 + block)
+        D[:c0, c0:c1] = D[c0:c1, :c0].T
+        square = D[c0:c1, c0:c1]
+        upper = np.triu_indices(c1 - c0, 1)
+        square[upper] = square.T[upper]
+
+
+def load_phylip_file(
+    file: str, dtype: type = np.float64, lower: bool = False, cache: bool = False
+) -> tuple[np.ndarray, list[str]]:
+    """
+    read_phylip_file, with cache keeping the matrix in a file.npy sidecar
+    (and the names in file.names) that is memory-mapped by later runs. The
+    sidecar is opened copy-on-write, so the matrix can be changed in memory.
+    """
+    if not cache:
+        return read_phylip_file(file, dtype, lower)
+    matrix, labels = f"{file}.npy", f"{file}.names"
+    fresh = all(os.path.exists(x) and os.path.getmtime(x) >= os.path.getmtime(file) for x in (matrix, labels))
+    if not fresh or np.load(matrix, mmap_mode="r").dtype != dtype:
+        D, names = read_phylip_file(file, dtype, lower, memmap=matrix)
+        D.flush()
+        del D
+        with open(labels, "w") as f:
+            f.writelines(f"{name}\n" for name in names)
+    with open(labels) as f:
+        names = f.read().splitlines()
+    return np.load(matrix, mmap_mode="c"), names
+
+
+def find_neighbours(D: np.ndarray, sums: np.ndarray, rank: np.ndarray, N: np.ndarray) -> tuple[int, int]:
+    """
+    Slots (i, j) of the pair minimizing N_ij = D_ij - (r_i + r_j) / (n - 2),
+    computed with NumPy in the buffer N. Ties are broken in the order the
+    nodes were created, with i created before j, as when the matrix is kept
+    in creation order.
+    """
+    n = len(D)
+    np.add(sums[:, None], sums[None, :], out=N)
+    N /= n - 2
+    np.subtract(D, N, out=N)
+    np.fill_diagonal(N, np.inf)
+    i, j = np.unravel_index(np.argmin(N), N.shape)
+    if rank[i] > rank[j]:
+        i, j = j, i
+    ties = np.argwhere(N == N[i, j])
+    if len(ties) > 2:
+        first = np.lexsort((rank[ties[:, 1]], rank[ties[:, 0]]))[0]
+        i, j = ties[first]
+    return int(i), int(j)
+
+
+def join_neighbours(D: np.ndarray, sums: np.ndarray, tree: ArrayTree, nodes: np.ndarray, i: int, j: int) -> int:
+    """New node joining i and j, gamma being the length of the branch to i"""
+    n = len(sums)
+    gamma = D[i, j] / 2 + (sums[i] - sums[j]) / (2 * (n - 2))
+    return tree.add_node([nodes[j], nodes[i]], [D[i, j] - gamma, gamma])
 
 
-def update_dissimilarity_matrix(D: np.ndarray, i: int, j: int):
-    d_ij = D[i, j]
-    row_i = np.delete(D[i,], (i, j))
-    col_j = np.delete(D[:, j], (i, j))
+def update_dissimilarity_matrix(D: np.ndarray, n: int, i: int, j: int) -> int:
+    """
+    Replace i and j by the joined node in the leading n x n block of D, in
+    place: the node takes the lowest of the two slots and the last slot is
+    moved into the other one. Returns the new number of active slots.
+    """
+    a, b = min(i, j), max(i, j)
+    row = 0.5 * (D[i, :n] + D[j, :n] - D[i, j])
+    row[a] = 0
+    D[a, :n] = D[:n, a] = row
+    n -= 1
+    if b != n:
+        D[b, :n] = D[n, :n]
+        D[:n, b] = D[:n, n]
+        D[b, b] = 0
+    return n
 
-    rows = [row for row in range(D.shape[0]) if row not in [i, j]]
-    rows.append(i)
-    cols = [col for col in range(D.shape[1]) if col not in [i, j]]
-    cols.append(i)
 
-    D = D[rows][:, cols]
+class SortedRows:
+    """
+    Exact search for the pair to join in the style of RapidNJ. Each node
+    keeps a row with its distances to the nodes created before it, sorted
+    increasingly, so every pair appears once, in the row of its newest node.
+    Since N_ik = D_ik - (r_i + r_k) / (n - 2) >= D_ik - (r_i + r_max) / (n - 2),
+    a row can only be scanned up to the first entry whose bound exceeds the
+    best N found. The rows are scanned together, a block of columns at a time.
+    With a tolerance, the pairs within it of the best are also found, and
+    the search gives up (None) if there are several.
+    """
 
-    k = -1
-    for m in range(len(D) - 1):
-        D[k, m] = D[m, k] = 0.5 * (row_i[m] + col_j[m] - d_ij)
-    return D
+    BLOCK = 8
 
+    def __init__(self, D: np.ndarray):
+        n = len(D)
+        # A last column of inf ends every row
+        lower = np.full((n, n + 1), np.inf, dtype=D.dtype)
+        lower[:, :n] = np.where(np.tri(n, k=-1, dtype=bool), D, np.inf)
+        order = np.argsort(lower, axis=1, kind="stable")
+        self.S = np.take_along_axis(lower, order, axis=1)
+        self.I = order.astype(np.int32)
+        # Nodes are identified by creation order, the sentinel id pads the rows
+        self.sentinel = 2 * n
+        self.I[np.isinf(self.S)] = self.sentinel
+        self.slot_of = np.full(2 * n + 1, -1)
+        self.slot_of[:n] = np.arange(n)
+        self.start = np.zeros(n, dtype=int)
 
-def terminate_nj(D: np.ndarray, clades: list[Clade]):
+    def find_neighbours(self, sums: np.ndarray, rank: np.ndarray, tolerance: float = 0.0) -> tuple[int, int] | None:
+        """Slots (i, j) of the same pair as the dense find_neighbours"""
+        n, last = len(sums), self.S.shape[1] - 1
+        lower = (sums + sums.max()) / (n - 2)
+        best, ties = np.inf, []
+        rows = np.arange(n)
+        rows = rows[np.isfinite(self.S[rows, self.start[rows]])]
+        pos = self.start[rows]
+        block = self.BLOCK
+        first = True
+        while len(rows):
+            cols = np.minimum(pos[:, None] + np.arange(block), last)
+            S = self.S[rows[:, None], cols]
+            slots = self.slot_of[self.I[rows[:, None], cols]]
+            alive = slots >= 0
+            N = np.where(alive, S - (sums[rows][:, None] + sums[slots]) / (n - 2), np.inf)
+            if first:
+                # Entries of joined nodes at the start of a row are skipped for good
+                dead = np.where(alive.any(axis=1), alive.argmax(axis=1), block)
+                self.start[rows] = np.minimum(pos + dead, last)
+                first = False
+            m = N.min()
+            if m < best:
+                best = m
+                ties = [tie for tie in ties if tie[0] <= best + tolerance]
+            if m <= best + tolerance:
+                r, c = np.nonzero(N <= best + tolerance)
+                ties.extend(zip(N[r, c], rank[slots[r, c]], rank[rows[r]]))
+            more = S[:, -1] - lower[rows] <= best + tolerance
+            rows, pos = rows[more], pos[more] + block
+            block *= 2
+        ties = [(old, new) for value, old, new in ties if value <= best + tolerance]
+        if tolerance and len(ties) > 1:
+            return None
+        old, new = min(ties)
+        slot = self.slot_of[[old, new]]
+        return int(slot[0]), int(slot[1])
+
+    def join(self, D: np.ndarray, n: int, rank: np.ndarray, joined: tuple[int, int], a: int, b: int):
+        """
+        Update the rows after the nodes joined were replaced in slots a < b
+        and D collapsed to n slots, rank holding the new node in slot a and
+        the node moved from the last slot in b.
+        """
+        self.slot_of[list(joined)] = -1
+        if b != n:
+            self.S[b], self.I[b], self.start[b] = self.S[n], self.I[n], self.start[n]
+            self.slot_of[rank[b]] = b
+        others = np.delete(np.arange(n), a)
+        order = others[np.argsort(D[a, others], kind="stable")]
+        self.S[a, : n - 1], self.S[a, n - 1 :] = D[a, order], np.inf
+        self.I[a, : n - 1], self.I[a, n - 1 :] = rank[order], self.sentinel
+        self.start[a] = 0
+        self.slot_of[rank[a]] = a
+
+
+def creation_order_sums(D: np.ndarray, n: int, rank: np.ndarray, sums: np.ndarray, block: int = 256):
+    """
+    Column sums of the leading n x n block of D into sums, adding the rows in
+    creation order of their nodes. Only block rows are gathered at a time, and
+    the running sums are added to the first of them, so the rows are still
+    added one after another as by a single sum over all of them.
+    """
+    order = np.argsort(rank[:n])
+    for start in range(0, n, block):
+        rows = D[order[start : start + block], :n]
+        if start:
+            rows[0] += sums[:n]
+        rows.sum(axis=0, out=sums[:n])
+
+
+def column_sum(D: np.ndarray, n: int, rank: np.ndarray, k: int):
+    """Sum of column k of the leading n x n block of D, as by creation_order_sums"""
+    return np.cumsum(D[np.argsort(rank[:n]), k])[-1]
+
+
+def update_sums(D: np.ndarray, n: int, sums: np.ndarray, removed: np.ndarray, a: int, b: int):
+    """
+    Column sums after update_dissimilarity_matrix collapsed D to n slots,
+    from those before it: removed holds the rows of the joined nodes added
+    up, the new node is in slot a and the node of the last slot moved to b.
+    """
+    sums[: n + 1] -= removed
+    if b != n:
+        sums[b] = sums[n]
+    sums[:n] += D[a, :n]
+    sums[a] = D[a, :n].sum()
+
+
+def terminate_nj(D: np.ndarray, tree: ArrayTree, nodes: list[int]) -> int:
     i, j, m = 0, 1, 2
+    lengths = [
+        0.5 * (D[i, j] + D[i, m] - D[j, m]),
+        0.5 * (D[i, j] + D[j, m] - D[i, m]),
+        0.5 * (D[i, m] + D[j, m] - D[i, j]),
+    ]
+    node = tree.add_node([nodes[m], nodes[j], nodes[i]], lengths[::-1])
+    return tree.add_node([node])
 
-    node = Clade(
-        clades=[
-            clades.pop(m),
-            clades.pop(j),
-            clades.pop(i),
-        ]
-    )
 
-    node.clades[i].branch_length = 0.5 * (D[i, j] + D[i, m] - D[j, m])
-    node.clades[j].branch_length = 0.5 * (D[i, j] + D[j, m] - D[i, m])
-    node.clades[m].branch_length = 0.5 * (D[i, m] + D[j, m] - D[i, j])
-    return node
+def neighbor_joining(
+    D: np.ndarray, leafs: list[str], search: str = "dense", overwrite: bool = False, timer: PhaseTimer = None
+):
+    """
+    Neighbor-joining in O(n^2) time per join. D is collapsed in place, so
+    only the leading n x n block is active. The pair to join is found by
+    computing all of N (search="dense") or with SortedRows ("sorted"). The
+    dense search recomputes the column sums at each join, adding the rows in
+    creation order: sums updated incrementally drift by rounding errors,
+    which breaks the ties between identical taxa and changes the tree. The
+    sorted search updates them incrementally in O(n) and only recomputes
+    them when the best pair is within the possible drift of another one, so
+    it joins the same pairs; the sums of the pair joined are made exact for
+    its branch lengths.
+    The computations are done in the floating point type of D, which is
+    only copied unless overwrite. The node ids of the tree are in creation
+    order, so rank also maps the slots of D to the nodes. The time spent
+    searching for neighbours and updating D and the tree goes to timer.
+    """
+    timer = timer or PhaseTimer()
+    with timer.phase("setup"):
+        if not overwrite or not np.issubdtype(D.dtype, np.floating):
+            D = np.array(D, dtype=np.result_type(D.dtype, np.float32))
+        n = len(D)
+        sums = np.empty(n, dtype=D.dtype)
+        rank = np.arange(n)
+        tree = ArrayTree(leafs)
+        if search == "sorted":
+            rows = SortedRows(D)
+            creation_order_sums(D, n, rank, sums)
+            # Bound of the drift of the sums, relative to the largest sum
+            drift, largest = 4 * n * np.finfo(D.dtype).eps, np.abs(sums).max()
+        else:
+            N = np.empty_like(D)
+    while n > 3:
+        if n % 10 == 0:
+            print(f"Iteration {n}", file=sys.stderr)
+        with timer.phase("search"):
+            if search == "sorted":
+                largest = max(largest, np.abs(sums[:n]).max())
+                pair = rows.find_neighbours(sums[:n], rank[:n], 2 * drift * largest / (n - 2))
+                if pair is None:
+                    creation_order_sums(D, n, rank, sums)
+                    pair = rows.find_neighbours(sums[:n], rank[:n])
+                i, j = pair
+                sums[i], sums[j] = column_sum(D, n, rank, i), column_sum(D, n, rank, j)
+            else:
+                creation_order_sums(D, n, rank, sums)
+                i, j = find_neighbours(D[:n, :n], sums[:n], rank[:n], N[:n, :n])
+        with timer.phase("update"):
+            a, b = min(i, j), max(i, j)
+            joined = rank[i], rank[j]
+            rank[a] = join_neighbours(D, sums[:n], tree, rank, i, j)
+            if search == "sorted":
+                removed = D[i, :n] + D[j, :n]
+            n = update_dissimilarity_matrix(D, n, i, j)
+            if b != n:
+                rank[b] = rank[n]
+            if search == "sorted":
+                update_sums(D, n, sums, removed, a, b)
+                rows.join(D, n, rank, joined, a, b)
+    with timer.phase("update"):
+        order = np.argsort(rank[:3])
+        terminate_nj(D[np.ix_(order, order)], tree, rank[order])
+    return tree
 
 
 if __name__ == "__main__":
-    D, leafs = read_phylip_file(sys.argv[1])
-    tree = create_start_tree(leafs)
-    clades = tree.clade.clades
-    while len(D) > 3:
-        if len(D) % 10 == 0:
-            print(f"Iteration {len(D)}", file=sys.stderr)
-        i, j = find_neighbours(D)
-        knode = join_neighbours(D, clades, i, j)
-        clades.append(knode)
-        D = update_dissimilarity_matrix(D, i, j)
-    final_node = terminate_nj(D, clades)
-    clades.append(final_node)
-    #
-    # tree = tree.common_ancestor(*tree.get_terminals())
-    # Phylo.draw_ascii(tree)
-    Phylo.write(tree, format="newick", file=sys.stdout)
+    parser = argparse.ArgumentParser(description="Neighbor-joining tree of a distance matrix in phylip-format")
+    parser.add_argument("file", help="distance matrix in phylip-format")
+    parser.add_argument(
+        "--search",
+        choices=["dense", "sorted"],
+        default="dense",
+        help="find the pair to join from the full N matrix, or from rows kept sorted as in RapidNJ",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=["float64", "float32"],
+        default="float64",
+        help="floating point type of the distances, float32 halves the memory",
+    )
+    parser.add_argument(
+        "--lower", action="store_true", help="only parse the lower triangle of a square matrix"
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="keep the parsed matrix in a memory-mapped FILE.npy sidecar for later runs",
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="JSON",
+        help="write the time of each phase, joins per second and peak RSS to this file",
+    )
+    args = parser.parse_args()
+    timer = PhaseTimer()
+    with timer.phase("parse"):
+        D, leafs = load_phylip_file(args.file, np.dtype(args.dtype), args.lower, args.cache)
+    tree = neighbor_joining(D, leafs, args.search, overwrite=True, timer=timer)
+    with timer.phase("newick"):
+        print(tree.newick())
+    if args.stats:
+        stats = {"file": args.file, "taxa": len(leafs), "search": args.search, "dtype": args.dtype}
+        with open(args.stats, "w") as f:
+            json.dump({**stats, **timer.stats(joins=max(len(leafs) - 3, 0))}, f, indent=2)